@@ -2,7 +2,7 @@
 
 import { useEffect, useMemo, useState } from "react";
 import Link from "next/link";
-import { db } from "@/lib/firebase";
+import { db, editableEntry, saveAttendanceDay } from "@/lib/firebase";
 import { collection, getDocs, doc, setDoc, getDoc } from "firebase/firestore";
 
 interface AttendanceEntry {
@@ -134,7 +134,7 @@ export default function AttendancePage() {
         [uid]: data
       };
 
-      await setDoc(dateRef, newData);
+      await saveAttendanceDay(date, newData);
 
       // Update local state immediately for better UX
       setAttendanceMap(prev => ({
@@ -143,7 +143,7 @@ export default function AttendancePage() {
       }));
     } catch (error) {
       console.error("Error updating attendance:", error);
-      alert("Failed to update attendance");
+      alert(`Failed to update attendance: ${(error as Error).message}`);
     }
   };
 
@@ -152,7 +152,7 @@ export default function AttendancePage() {
     const day = attendanceMap[selectedDate] || {};
     const entry = day[uid] || { sign_in_time: null, sign_out_time: null, signed_in: false, hours: 0 };
 
-    const newEntry = { ...entry };
+    const newEntry = editableEntry(entry);
     if (newEntry.signed_in) {
       // sign out
       newEntry.signed_in = false;
@@ -230,14 +230,14 @@ export default function AttendancePage() {
         }
 
         updates[user.uid] = {
-          ...entry,
+          ...editableEntry(entry),
           signed_in: false,
           sign_out_time: now.toISOString(),
           hours: hours
         };
       }
 
-      await setDoc(dateRef, {
+      await saveAttendanceDay(selectedDate, {
         ...currentData,
         ...updates
       });
@@ -254,7 +254,7 @@ export default function AttendancePage() {
       alert(`Successfully signed out ${signedInUsers.length} users.`);
     } catch (error) {
       console.error("Error signing out all:", error);
-      alert("Failed to sign out users.");
+      alert(`Failed to sign out users: ${(error as Error).message}`);
     }
   };
 
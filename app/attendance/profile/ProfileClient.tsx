@@ -3,8 +3,8 @@
 import { useEffect, useState } from 'react';
 import Link from 'next/link';
 import { useSearchParams } from 'next/navigation';
-import { db } from '@/lib/firebase';
-import { collection, getDocs, doc, getDoc, setDoc } from 'firebase/firestore';
+import { db, editableEntry, saveAttendanceDay } from '@/lib/firebase';
+import { collection, getDocs, doc, getDoc } from 'firebase/firestore';
 
 interface AttendanceDay {
   date: string;
@@ -179,7 +179,7 @@ export default function ProfileClient() {
 
       const existingEntry = currentData[uid] || {};
 
-      let newDataForUser = { ...existingEntry };
+      let newDataForUser = editableEntry(existingEntry);
 
       if (!editAttended) {
         newDataForUser = {
@@ -210,7 +210,7 @@ export default function ProfileClient() {
         }
       }
 
-      await setDoc(dateRef, {
+      await saveAttendanceDay(editDate, {
         ...currentData,
         [uid]: newDataForUser
       });
@@ -219,7 +219,7 @@ export default function ProfileClient() {
       fetchProfile(); // Refresh data
     } catch (error) {
       console.error("Error saving attendance:", error);
-      alert("Failed to save attendance");
+      alert(`Failed to save attendance: ${(error as Error).message}`);
     }
   };
 
@@ -1,5 +1,5 @@
 import { initializeApp } from "firebase/app";
-import { getFirestore } from "firebase/firestore";
+import { getFirestore, doc, collection, getDocs, limit, query, writeBatch, serverTimestamp } from "firebase/firestore";
 
 const firebaseConfig = {
     apiKey: process.env.NEXT_PUBLIC_FIREBASE_API_KEY,
@@ -13,3 +13,22 @@ const firebaseConfig = {
 
 const app = initializeApp(firebaseConfig);
 export const db = getFirestore(app);
+
+// Write a day's attendance together with its change stamp, in one batch, so the
+// backend's local cache of past days can never miss the edit. Days stored in the
+// per-member layout (ATTENDANCE_LAYOUT=member) are refused: their entries live in
+// attendance/<date>/members, which these pages don't read or write.
+export const saveAttendanceDay = async (date: string, data: object) => {
+    const members = await getDocs(query(collection(db, "attendance", date, "members"), limit(1)));
+    if (!members.empty) {
+        throw new Error(`${date} uses the per-member layout and can't be edited here`);
+    }
+    const batch = writeBatch(db);
+    batch.set(doc(db, "attendance", date), data);
+    batch.set(doc(db, "attendance_changes", date), { updated_at: serverTimestamp() });
+    return batch.commit();
+};
+
+// Copy an entry for editing without its per-visit `sessions`, which the pages
+// don't maintain; the backend rebuilds them from the edited summary fields
+export const editableEntry = ({ sessions, ...entry }: any = {}) => entry;
@@ -0,0 +1,249 @@
+"""
+Incremental local backup (and restore) of the `attendance`, `attendance_events` and `card_names` collections.
+
+Run from the project root:
+    python3 scripts/backup_attendance.py backup [--dir backups] [--full]
+    python3 scripts/backup_attendance.py restore [--dir backups] [--to-json out_dir]
+
+Each backup run writes a gzip-compressed JSON-lines snapshot containing only the
+documents whose content hash changed since the previous run (plus tombstones for
+deleted documents). `manifest.json` keeps the hash of every document and the
+ordered list of snapshots. Restore replays the snapshots in order.
+
+After the first run only some attendance days are read: days stamped in
+`attendance_changes` since the previous run, plus every day from the previous
+run's date through today (tap writes to the current day aren't stamped). The
+tap events of those days are read with them.
+
+Attendance days are backed up whole, with the entries of member-layout days
+(`attendance/<date>/members/<uid>`) folded in, and restored in whichever
+layout `ATTENDANCE_LAYOUT` selects.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+
+COLLECTIONS = ("attendance", "attendance_events", "card_names")
+MANIFEST = "manifest.json"
+# Firestore allows at most 500 writes per batch; a restored entry is at most a few writes
+BATCH_SIZE = 80
+
+
+def content_hash(data):
+    encoded = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def load_manifest(backup_dir):
+    path = os.path.join(backup_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {"hashes": {c: {} for c in COLLECTIONS}, "snapshots": []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(backup_dir, manifest):
+    # Write to a temp file and rename so a crash never leaves a torn manifest
+    path = os.path.join(backup_dir, MANIFEST)
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def changed_days(manifest):
+    """(days to read, new change cursor) since the manifest's last run; days is None for a full scan"""
+    started = datetime.now().timestamp()
+    cursor, last_day = manifest.get("cursor"), manifest.get("lastDay")
+    if cursor is None or last_day is None:
+        return None, started
+    days = set()
+    new_cursor = cursor
+    for day, stamp in server.iter_day_changes(cursor):
+        days.add(day)
+        new_cursor = max(new_cursor, stamp)
+    day = date.fromisoformat(last_day)
+    while day <= date.today():
+        days.add(day.isoformat())
+        day += timedelta(days=1)
+    return sorted(days), new_cursor
+
+
+def iter_documents(collection, days=None):
+    """Yield (doc_id, data) for one backed-up collection, limited to `days` where that applies.
+
+    Attendance days come from the server's day readers, so member-layout days
+    are backed up with their `members` subcollection folded in.
+    """
+    if collection == "attendance":
+        if days is None:
+            yield from server.iter_attendance_days()
+            return
+        refs = [server.db.collection('attendance').document(day) for day in days]
+        for snap in server.db.get_all(refs):
+            if snap.exists:
+                yield snap.id, server.read_day_data(snap.id, snap.to_dict() or {})
+        return
+    if collection == "attendance_events" and days is not None:
+        for day in days:
+            for doc in server.db.collection(collection).where('day', '==', day).stream():
+                yield doc.id, doc.to_dict() or {}
+        return
+    for doc in server.db.collection(collection).stream():
+        yield doc.id, doc.to_dict() or {}
+
+
+def backup(backup_dir, full=False):
+    os.makedirs(backup_dir, exist_ok=True)
+    manifest = load_manifest(backup_dir)
+    if full:
+        manifest = {"hashes": {c: {} for c in COLLECTIONS}, "snapshots": []}
+
+    name = f"snapshot-{datetime.now().strftime('%Y%m%dT%H%M%S%f')}.jsonl.gz"
+    path = os.path.join(backup_dir, name)
+    changed = deleted = scanned = 0
+    days, cursor = changed_days(manifest)
+
+    with gzip.open(path, 'wt', encoding='utf-8') as out:
+        for collection in COLLECTIONS:
+            previous = manifest["hashes"].setdefault(collection, {})
+            partial = days is not None and collection != "card_names"
+            current = dict(previous) if partial else {}
+            seen = set()
+            for doc_id, data in iter_documents(collection, days):
+                scanned += 1
+                seen.add(doc_id)
+                digest = content_hash(data)
+                current[doc_id] = digest
+                if previous.get(doc_id) != digest:
+                    out.write(json.dumps({"collection": collection, "id": doc_id, "data": data}, default=str) + "\n")
+                    changed += 1
+            if not partial:
+                gone = previous.keys() - seen
+            elif collection == "attendance":
+                # Only the days that were read can be known to be gone; events are never deleted
+                gone = {day for day in days if day in previous and day not in seen}
+            else:
+                gone = set()
+            for doc_id in gone:
+                out.write(json.dumps({"collection": collection, "id": doc_id, "deleted": True}) + "\n")
+                current.pop(doc_id, None)
+                deleted += 1
+            manifest["hashes"][collection] = current
+    manifest["cursor"] = cursor
+    manifest["lastDay"] = date.today().isoformat()
+
+    if changed == 0 and deleted == 0:
+        os.remove(path)
+        save_manifest(backup_dir, manifest)
+        print(f"No changes across {scanned} documents; nothing written.")
+        return
+
+    manifest["snapshots"].append(name)
+    save_manifest(backup_dir, manifest)
+    print(f"Wrote {name}: {changed} changed, {deleted} deleted of {scanned} documents.")
+
+
+def load_backup_state(backup_dir):
+    """Replay every snapshot in order and return {collection: {doc_id: data}}"""
+    manifest = load_manifest(backup_dir)
+    state = {c: {} for c in COLLECTIONS}
+    for name in manifest["snapshots"]:
+        with gzip.open(os.path.join(backup_dir, name), 'rt', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                docs = state.setdefault(record["collection"], {})
+                if record.get("deleted"):
+                    docs.pop(record["id"], None)
+                else:
+                    docs[record["id"]] = record["data"]
+    return state
+
+
+def restore(backup_dir, to_json=None):
+    state = load_backup_state(backup_dir)
+
+    if to_json:
+        # Same shape as public/attendance.json and public/card_names.json
+        os.makedirs(to_json, exist_ok=True)
+        with open(os.path.join(to_json, "attendance.json"), 'w') as f:
+            json.dump(dict(sorted(state["attendance"].items())), f, indent=2)
+        with open(os.path.join(to_json, "card_names.json"), 'w') as f:
+            json.dump({uid: data.get("name") for uid, data in state["card_names"].items()}, f, indent=2)
+        print(f"Restored {len(state['attendance'])} days and {len(state['card_names'])} names to {to_json}")
+        return
+
+    written = 0
+    for chunk in iter_batches(iter_restore_writes(state), BATCH_SIZE):
+        batch = server.db.batch()
+        for collection, doc_id, payload in chunk:
+            if isinstance(payload, server.AttendanceEntry):
+                server.queue_entry_write(batch, doc_id, payload)
+            elif collection == "attendance":
+                batch.set(server.db.collection(collection).document(doc_id), payload, merge=True)
+            else:
+                batch.set(server.db.collection(collection).document(doc_id), payload)
+        for day in {doc_id for collection, doc_id, _ in chunk if collection == "attendance"}:
+            # Restored days must be refetched by the server's past-day cache
+            server.queue_day_changed(batch, day)
+        batch.commit()
+        written += len(chunk)
+    print(f"Restored {written} documents and entries to Firestore.")
+
+
+def iter_restore_writes(state):
+    """Yield (collection, doc_id, payload) for every write a restore makes.
+
+    Attendance days are split into their entries, written with the server's
+    queue_entry_write so they land in the configured ATTENDANCE_LAYOUT.
+    """
+    for collection, docs in state.items():
+        for doc_id, data in docs.items():
+            if collection != "attendance":
+                yield collection, doc_id, data
+                continue
+            attendance_day = server.AttendanceDay.from_dict(doc_id, data)
+            for entry in attendance_day.entries.values():
+                yield collection, doc_id, entry
+            if attendance_day.extra:
+                yield collection, doc_id, attendance_day.extra
+
+
+def iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental backup of attendance data")
+    parser.add_argument("command", choices=["backup", "restore"])
+    parser.add_argument("--dir", default="backups", help="Backup directory")
+    parser.add_argument("--full", action="store_true", help="Start a new full backup chain")
+    parser.add_argument("--to-json", help="Restore into JSON files in this directory instead of Firestore")
+    args = parser.parse_args()
+
+    if server.db is None and not (args.command == "restore" and args.to_json):
+        print("Error: Firestore is not available.")
+        sys.exit(1)
+
+    if args.command == "backup":
+        backup(args.dir, args.full)
+    else:
+        restore(args.dir, args.to_json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Benchmark reader I/O against a recorded session, without hardware.
+
+Record a session on a machine with the reader attached:
+    NFC_TRANSPORT=record:reader.jsonl python3 server.py
+Then replay it anywhere:
+    python3 scripts/bench_reader.py reader.jsonl --iterations 200 [--latency]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a reader recording and report per-command latency")
+    parser.add_argument("recording", help="JSON-lines file written with NFC_TRANSPORT=record:<path>")
+    parser.add_argument("--iterations", type=int, default=100, help="Detection cycles to run")
+    parser.add_argument("--latency", action="store_true", help="Sleep the recorded latency of each exchange")
+    args = parser.parse_args()
+
+    # The transport is chosen at import time
+    os.environ['NFC_TRANSPORT'] = f"replay:{args.recording}"
+    if args.latency:
+        os.environ['NFC_REPLAY_LATENCY'] = '1'
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    import server
+
+    server.init_nfc_reader()
+    started = time.perf_counter()
+    for _ in range(args.iterations):
+        # One detection cycle: presence check followed by UID and ATR reads
+        if server.check_card_present():
+            server.read_card_with_retry()
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.iterations} cycles in {elapsed:.3f}s ({elapsed / args.iterations * 1000:.2f} ms/cycle)")
+    print(json.dumps(server.reader_stats.snapshot(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
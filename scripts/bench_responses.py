@@ -0,0 +1,94 @@
+"""
+Benchmark response encodings for the large read endpoints.
+
+Builds a synthetic multi-season profile (or a live one with --uid) and reports
+the size and encode time of each body format and compression the server can
+negotiate:
+    python3 scripts/bench_responses.py --seasons 3 --iterations 50
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+
+
+def synthetic_profile(seasons):
+    """A profile shaped like get_person_profile's, with ~150 meeting days per season"""
+    rng = random.Random(42)
+    history = []
+    day = date.today()
+    for _ in range(seasons * 150):
+        day -= timedelta(days=rng.choice((1, 2, 3)))
+        if rng.random() < 0.8:
+            hours = round(rng.uniform(1, 4), 2)
+            history.append({
+                "date": day.isoformat(),
+                "signInTime": f"{day.isoformat()}T15:{rng.randint(10, 59)}:{rng.randint(10, 59)}.{rng.randint(0, 999999):06d}",
+                "signOutTime": f"{day.isoformat()}T18:{rng.randint(10, 59)}:{rng.randint(10, 59)}.{rng.randint(0, 999999):06d}",
+                "hours": hours,
+                "signedIn": False,
+                "attended": True
+            })
+        else:
+            history.append({"date": day.isoformat(), "signInTime": None, "signOutTime": None,
+                            "hours": 0, "signedIn": False, "attended": False})
+    return {"uid": "04 A1 B2 C3", "name": "Sample Member", "attendanceHistory": history}
+
+
+def timed(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        result = fn()
+    return result, (time.perf_counter() - started) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare response sizes and encode times")
+    parser.add_argument("--seasons", type=int, default=3, help="Seasons of synthetic history")
+    parser.add_argument("--uid", help="Benchmark this member's real profile instead")
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    profile = server.get_person_profile(args.uid) if args.uid else synthetic_profile(args.seasons)
+    if profile is None:
+        print(f"No profile for {args.uid}")
+        sys.exit(1)
+    rows = {"success": True, "profile": profile}
+    columnar = {"success": True, "profile": dict(profile, attendanceHistory=server.to_columns(profile["attendanceHistory"]))}
+    print(f"{len(profile['attendanceHistory'])} history rows; "
+          f"orjson={'yes' if server.orjson else 'no'} brotli={'yes' if server.brotli else 'no'} "
+          f"msgpack={'yes' if server.msgpack else 'no'}")
+
+    bodies = [
+        # What jsonify sends with the server's debug=True (pretty-printed)
+        ("json rows (before)", lambda: json.dumps(rows, indent=2).encode()),
+        ("json rows", lambda: server.encode_json(rows)),
+        ("json columnar", lambda: server.encode_json(columnar)),
+    ]
+    if server.msgpack:
+        bodies.append(("msgpack columnar", lambda: server.msgpack.packb(columnar, use_bin_type=True)))
+
+    codings = [("identity", lambda b: b), ("gzip", lambda b: gzip.compress(b, compresslevel=server.GZIP_LEVEL))]
+    if server.brotli:
+        codings.append(("br", lambda b: server.brotli.compress(b, quality=server.BROTLI_QUALITY)))
+
+    baseline = None
+    print(f"{'body':<20} {'coding':<9} {'bytes':>9} {'ratio':>7} {'encode ms':>10}")
+    for name, encode in bodies:
+        body, encode_ms = timed(encode, args.iterations)
+        for coding, compress in codings:
+            compressed, compress_ms = timed(lambda: compress(body), args.iterations)
+            baseline = baseline or len(compressed)
+            print(f"{name:<20} {coding:<9} {len(compressed):>9} {len(compressed) / baseline:>7.2f} "
+                  f"{encode_ms + (compress_ms if coding != 'identity' else 0):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
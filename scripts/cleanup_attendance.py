@@ -1,90 +1,43 @@
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
-from datetime import datetime, timedelta, date
+from datetime import date, timedelta
 import os
 import sys
 
-# Add parent directory to path to import from server.py if needed, 
-# but we'll just use standalone logic here for simplicity and safety.
-
-def initialize_firebase():
-    cred_path = 'serviceAccountKey.json'
-    if os.path.exists(cred_path):
-        cred = credentials.Certificate(cred_path)
-        firebase_admin.initialize_app(cred)
-        print(f"Initialized Firebase with {cred_path}")
-    else:
-        # Try to find it in the parent directory
-        parent_cred_path = os.path.join('..', cred_path)
-        if os.path.exists(parent_cred_path):
-             cred = credentials.Certificate(parent_cred_path)
-             firebase_admin.initialize_app(cred)
-             print(f"Initialized Firebase with {parent_cred_path}")
-        else:
-            print("Error: serviceAccountKey.json not found.")
-            sys.exit(1)
-    
-    return firestore.client()
+# Run from the project root or from scripts/; server.py provides the Firestore
+# client and the shared attendance model.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+from server import AttendanceDay, format_timestamp
 
 def cleanup_attendance():
-    db = initialize_firebase()
+    db = server.db
+    if db is None:
+        print("Error: Firestore is not available.")
+        sys.exit(1)
     
     today_str = date.today().isoformat()
     print(f"Today is: {today_str}")
     
-    # Get all attendance documents
-    docs = db.collection('attendance').stream()
+    # Every past day, in either storage layout; today is left to auto sign-out
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
     
     updated_count = 0
     
-    for doc in docs:
-        day_str = doc.id
+    for day_str, data in server.iter_attendance_days(end=yesterday):
+        attendance_day = AttendanceDay.from_dict(day_str, data)
         
-        # Skip today
-        if day_str == today_str:
-            print(f"Skipping today ({day_str})")
-            continue
-            
-        # Check if day is in the future (just in case)
-        if day_str > today_str:
-            print(f"Skipping future date ({day_str})")
-            continue
-            
-        data = doc.to_dict()
-        day_updated = False
-        
-        for uid, record in data.items():
-            if not isinstance(record, dict):
-                continue
-                
-            if record.get('signed_in', False):
+        for uid, entry in attendance_day.entries.items():
+            if entry.signed_in:
                 print(f"Found open sign-in for {uid} on {day_str}")
                 
-                # Calculate new sign-out time (sign_in_time + 2 hours)
-                sign_in_time_str = record.get('sign_in_time')
-                if sign_in_time_str:
-                    try:
-                        sign_in_time = datetime.fromisoformat(sign_in_time_str)
-                        sign_out_time = sign_in_time + timedelta(hours=2)
-                        
-                        # Update record
-                        record['signed_in'] = False
-                        record['sign_out_time'] = sign_out_time.isoformat()
-                        record['hours'] = 2.0
-                        
-                        day_updated = True
+                if entry.sign_in is not None:
+                    # Close the open session at the hours policy's auto-close time, through
+                    # the event log like auto sign-out, so rebuilds from events keep it
+                    close_at = server.hours_policy.auto_close_at(entry.sessions[-1][0])
+                    if server.append_tap_event(uid, "sign_out", close_at, source="auto", day=day_str):
                         updated_count += 1
-                        print(f"  -> Updated: Set to 2 hours, signed out at {sign_out_time.isoformat()}")
-                    except ValueError:
-                        print(f"  -> Error parsing time for {uid}: {sign_in_time_str}")
+                        print(f"  -> Updated: signed out at {format_timestamp(close_at)}")
                 else:
-                    print(f"  -> Error: No sign_in_time for {uid}")
-        
-        if day_updated:
-            # Update the document
-            db.collection('attendance').document(day_str).set(data)
-            print(f"Saved updates for {day_str}")
+                    print(f"  -> Error: No valid sign_in_time for {uid}")
             
     print(f"\nCleanup complete. Updated {updated_count} records.")
 
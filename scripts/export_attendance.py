@@ -0,0 +1,47 @@
+"""
+Export attendance history joined with card names as CSV or Parquet.
+
+Run from the project root:
+    python3 scripts/export_attendance.py --format csv --start 2025-09-01 --end 2026-06-30 -o season.csv
+Rows are streamed from Firestore a page at a time, so memory use stays flat.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export attendance history")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--start", help="First date to include (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Last date to include (YYYY-MM-DD)")
+    parser.add_argument("--uid", help="Only export this card UID")
+    parser.add_argument("-o", "--output", help="Output file (defaults to stdout for CSV)")
+    args = parser.parse_args()
+
+    if server.db is None:
+        print("Error: Firestore is not available.", file=sys.stderr)
+        sys.exit(1)
+    if args.format == "parquet" and not args.output:
+        print("Error: Parquet export needs --output.", file=sys.stderr)
+        sys.exit(1)
+
+    rows = server.iter_attendance_rows(args.start, args.end, args.uid)
+    if args.format == "csv":
+        out = open(args.output, 'w', newline='') if args.output else sys.stdout
+        for chunk in server.iter_export_csv(rows):
+            out.write(chunk)
+    else:
+        out = open(args.output, 'wb')
+        for chunk in server.iter_export_parquet(rows):
+            out.write(chunk)
+    if out is not sys.stdout:
+        out.close()
+        print(f"Exported attendance to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
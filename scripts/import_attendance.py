@@ -0,0 +1,277 @@
+"""
+Bulk import / backfill attendance and card names into Firestore.
+
+Accepts the same shapes as `public/attendance.json` and `public/card_names.json`:
+    attendance:  {"2025-11-12": {"<uid>": {entry}, ...}, ...}
+    card names:  {"<uid>": "<name>", ...}
+or JSON-lines with one record per line:
+    attendance:  {"date": "2025-11-12", "uid": "<uid>", "sign_in_time": ..., ...}
+    card names:  {"uid": "<uid>", "name": "<name>"}
+
+Run from the project root:
+    python3 scripts/import_attendance.py --attendance public/attendance.json --card-names public/card_names.json
+
+Every entry is validated first. Entries that already match Firestore are skipped,
+so re-running the same import performs no writes.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+
+# Documents (days or names) read per get_all round trip
+DOCS_PER_BATCH = 200
+# Firestore allows at most 500 writes per batch; an entry is at most a few writes
+ENTRIES_PER_BATCH = 100
+
+
+def iter_json_object(path):
+    """Yield (key, value) pairs of a top-level JSON object.
+
+    Uses `ijson` to stream when it is installed, otherwise loads the file whole.
+    """
+    try:
+        import ijson
+    except ImportError:
+        with open(path) as f:
+            yield from json.load(f).items()
+        return
+    with open(path, 'rb') as f:
+        # use_float: hours like 0.56 must stay floats, not Decimal, to pass validation
+        yield from ijson.kvitems(f, '', use_float=True)
+
+
+def is_json_lines(path):
+    return path.endswith('.jsonl') or path.endswith('.ndjson')
+
+
+def iter_attendance_records(path):
+    """Yield (day, uid, entry) records from either supported attendance format"""
+    if is_json_lines(path):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                entry = {k: record[k] for k in record if k not in ("date", "uid")}
+                yield record.get("date"), record.get("uid"), entry
+    else:
+        for day, entries in iter_json_object(path):
+            if not isinstance(entries, dict):
+                yield day, None, entries
+                continue
+            for uid, entry in entries.items():
+                yield day, uid, entry
+
+
+def iter_card_name_records(path):
+    """Yield (uid, name) records from either supported card name format"""
+    if is_json_lines(path):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    yield record.get("uid"), record.get("name")
+    else:
+        yield from iter_json_object(path)
+
+
+def normalize_entry(entry):
+    """Keep only the stored fields, with the defaults the server writes"""
+    normalized = {
+        "sign_in_time": entry.get("sign_in_time"),
+        "sign_out_time": entry.get("sign_out_time"),
+        "hours": entry.get("hours", 0),
+        "signed_in": entry.get("signed_in", False)
+    }
+    for key, value in entry.items():
+        if key not in normalized:
+            normalized[key] = value
+    return normalized
+
+
+def iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ImportStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = 0
+        self.invalid = 0
+        self.written = 0
+        self.unchanged = 0
+        self.started = time.perf_counter()
+
+    def add(self, written, unchanged):
+        with self.lock:
+            self.written += written
+            self.unchanged += unchanged
+
+    def report(self, label):
+        elapsed = time.perf_counter() - self.started
+        rate = self.records / elapsed if elapsed > 0 else 0
+        print(f"{label}: {self.records} records ({self.invalid} invalid), {self.written} written, "
+              f"{self.unchanged} unchanged in {elapsed:.2f}s ({rate:.0f} records/s)")
+
+
+def field_matches(current, value):
+    """True if a merge of `value` would not change `current`"""
+    if isinstance(value, dict) and isinstance(current, dict):
+        return all(current.get(k) == v for k, v in value.items())
+    return current == value
+
+
+def upsert_card_names(docs, stats, dry_run):
+    """Merge a batch of {uid: fields} into card_names, skipping fields that already match.
+
+    One get_all round trip reads the current state of the whole batch, and one
+    batched commit writes only what differs.
+    """
+    db = server.db
+    refs = [db.collection('card_names').document(doc_id) for doc_id in docs]
+    existing = {snap.id: (snap.to_dict() or {}) if snap.exists else {} for snap in db.get_all(refs)}
+
+    batch = db.batch()
+    written = unchanged = 0
+    for ref in refs:
+        current = existing.get(ref.id, {})
+        changes = {}
+        for field, value in docs[ref.id].items():
+            if field_matches(current.get(field), value):
+                unchanged += 1
+            else:
+                changes[field] = value
+        if changes:
+            written += len(changes)
+            batch.set(ref, changes, merge=True)
+    if written and not dry_run:
+        batch.commit()
+    stats.add(written, unchanged)
+
+
+def upsert_attendance(days, stats, dry_run):
+    """Write a batch of {day: {uid: entry}}, skipping entries that already match.
+
+    Current entries are read with one get_all over the day documents (plus the
+    members subcollection of member-layout days) and written with the server's
+    queue_entry_write, so imports follow ATTENDANCE_LAYOUT.
+    """
+    db = server.db
+    refs = [db.collection('attendance').document(day) for day in days]
+    batch = db.batch()
+    pending = written = unchanged = 0
+    for snap in db.get_all(refs):
+        current = server.read_day_data(snap.id, snap.to_dict() or {}) if snap.exists else {}
+        day_written = False
+        for uid, value in days[snap.id].items():
+            entry = server.AttendanceEntry.from_dict(uid, value)
+            if field_matches(current.get(uid), entry.to_dict()):
+                unchanged += 1
+                continue
+            written += 1
+            day_written = True
+            server.queue_entry_write(batch, snap.id, entry)
+            pending += 1
+            if pending >= ENTRIES_PER_BATCH and not dry_run:
+                server.queue_day_changed(batch, snap.id)
+                batch.commit()
+                batch = db.batch()
+                pending = 0
+        if day_written:
+            # Imported days must be refetched by the server's past-day cache
+            server.queue_day_changed(batch, snap.id)
+    if pending and not dry_run:
+        batch.commit()
+    stats.add(written, unchanged)
+
+
+def run_import(upsert, records, stats, workers, dry_run):
+    """Group validated records into document batches and upsert them on a worker pool.
+
+    Input is consumed as it streams in; at most a few batches are held in
+    memory at once. A document split across batches is still merged correctly.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        docs = {}
+        for doc_id, field, value in records:
+            docs.setdefault(doc_id, {})[field] = value
+            if len(docs) >= DOCS_PER_BATCH:
+                pending.append(pool.submit(upsert, docs, stats, dry_run))
+                docs = {}
+                # Backpressure: don't read further ahead than the pool can write
+                while len(pending) >= workers * 2:
+                    pending.pop(0).result()
+        if docs:
+            pending.append(pool.submit(upsert, docs, stats, dry_run))
+        for future in pending:
+            future.result()
+
+
+def validated_attendance(path, stats):
+    for day, uid, entry in iter_attendance_records(path):
+        stats.records += 1
+        problems = server.validate_attendance_entry(day, uid, entry)
+        if problems:
+            stats.invalid += 1
+            print(f"Skipping {day} {uid}: {'; '.join(problems)}")
+            continue
+        yield day, uid, normalize_entry(entry)
+
+
+def validated_card_names(path, stats):
+    for uid, name in iter_card_name_records(path):
+        stats.records += 1
+        if not isinstance(uid, str) or not uid.strip() or not isinstance(name, str) or not name.strip():
+            stats.invalid += 1
+            print(f"Skipping card name {uid!r}: {name!r}")
+            continue
+        yield uid, "name", name.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import attendance history and card names into Firestore")
+    parser.add_argument("--attendance", help="Attendance JSON or JSON-lines file")
+    parser.add_argument("--card-names", help="Card names JSON or JSON-lines file")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent batch writers")
+    parser.add_argument("--dry-run", action="store_true", help="Validate and diff without writing")
+    args = parser.parse_args()
+
+    if not args.attendance and not args.card_names:
+        parser.error("nothing to import: pass --attendance and/or --card-names")
+    if server.db is None:
+        print("Error: Firestore is not available.")
+        sys.exit(1)
+
+    if args.card_names:
+        stats = ImportStats()
+        run_import(upsert_card_names, validated_card_names(args.card_names, stats), stats, args.workers, args.dry_run)
+        stats.report("Card names")
+
+    if args.attendance:
+        stats = ImportStats()
+        run_import(upsert_attendance, validated_attendance(args.attendance, stats), stats, args.workers, args.dry_run)
+        stats.report("Attendance")
+
+    if args.dry_run:
+        print("Dry run: nothing was written.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Move attendance days between the day layout and the per-member layout.
+
+    day layout:    attendance/<date> = {<uid>: {entry}, ...}
+    member layout: attendance/<date>/members/<uid> = {entry, "uid": ..., "day": ...}
+                   with attendance/<date> left empty
+
+Run from the project root:
+    python3 scripts/migrate_attendance_layout.py --to member [--start 2025-09-01] [--end 2026-06-30] [--dry-run]
+Then set ATTENDANCE_LAYOUT=member for the server. Each day is moved in one
+batch, so a day is never left half migrated. Days already in the target layout
+are skipped. A day with entries in both places (e.g. an attendance page wrote to
+a member-layout day) is merged, the member documents winning.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+
+
+def migrate_day_to_member(day, data, dry_run):
+    entries = {uid: entry for uid, entry in data.items() if isinstance(entry, dict)}
+    if not entries:
+        return 0
+    members = server.members_collection(day)
+    existing = {doc.id for doc in members.stream()}
+    moved = [uid for uid in entries if uid not in existing]
+    if not dry_run:
+        batch = server.db.batch()
+        for uid in moved:
+            batch.set(members.document(uid), dict(entries[uid], uid=uid, day=day))
+        # Keep any non-member fields on the day document
+        batch.set(server.db.collection('attendance').document(day),
+                  {k: v for k, v in data.items() if k not in entries})
+        batch.commit()
+    return len(moved)
+
+
+def migrate_day_to_day_layout(day, data, dry_run):
+    members = list(server.members_collection(day).stream())
+    if not members:
+        return 0
+    if not dry_run:
+        merged = dict(data)
+        batch = server.db.batch()
+        for doc in members:
+            merged[doc.id] = server.member_doc_to_entry(doc.to_dict())
+            batch.delete(doc.reference)
+        batch.set(server.db.collection('attendance').document(day), merged)
+        batch.commit()
+    return len(members)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate attendance storage layout")
+    parser.add_argument("--to", choices=["member", "day"], required=True, help="Target layout")
+    parser.add_argument("--start", help="First date to migrate (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Last date to migrate (YYYY-MM-DD)")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would move without writing")
+    args = parser.parse_args()
+
+    if server.db is None:
+        print("Error: Firestore is not available.")
+        sys.exit(1)
+
+    collection = server.db.collection('attendance')
+    query = collection.order_by(server.firestore.FieldPath.document_id())
+    if args.start:
+        query = query.where(server.firestore.FieldPath.document_id(), '>=', collection.document(args.start))
+    if args.end:
+        query = query.where(server.firestore.FieldPath.document_id(), '<=', collection.document(args.end))
+
+    days = moved = 0
+    for doc in query.stream():
+        data = doc.to_dict() or {}
+        if args.to == "member":
+            count = migrate_day_to_member(doc.id, data, args.dry_run)
+        else:
+            count = migrate_day_to_day_layout(doc.id, data, args.dry_run)
+        if count:
+            days += 1
+            moved += count
+            print(f"{doc.id}: {'would move' if args.dry_run else 'moved'} {count} entries")
+
+    print(f"\n{'Dry run: ' if args.dry_run else ''}{moved} entries across {days} days migrated to the {args.to} layout.")
+
+
+if __name__ == "__main__":
+    main()
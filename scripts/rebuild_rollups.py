@@ -0,0 +1,29 @@
+"""
+Regenerate the weekly, monthly and season rollups from the attendance documents.
+
+Run from the project root:
+    python3 scripts/rebuild_rollups.py [--start 2025-09-01] [--end 2026-06-30]
+Without a range every day on record is rebuilt.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild attendance rollups")
+    parser.add_argument("--start", help="First day to rebuild (ISO date)")
+    parser.add_argument("--end", help="Last day to rebuild (ISO date)")
+    args = parser.parse_args()
+    if server.db is None:
+        print("Error: Firestore is not available.")
+        sys.exit(1)
+    count = server.rebuild_rollups(args.start, args.end)
+    print(f"Rebuilt rollups from {count} attendance days")
+
+
+if __name__ == "__main__":
+    main()
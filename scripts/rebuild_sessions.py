@@ -0,0 +1,29 @@
+"""
+Re-derive the per-day attendance documents from the tap event log.
+
+Run from the project root:
+    python3 scripts/rebuild_sessions.py 2026-01-10 [2026-01-11 ...]
+Only members with logged events on a day are rewritten.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+
+
+def main():
+    days = sys.argv[1:]
+    if not days:
+        print("Usage: python3 scripts/rebuild_sessions.py YYYY-MM-DD [YYYY-MM-DD ...]")
+        sys.exit(1)
+    if server.db is None:
+        print("Error: Firestore is not available.")
+        sys.exit(1)
+    for day in days:
+        count = server.rebuild_day_from_events(day)
+        print(f"{day}: rebuilt {count} members from the event log")
+
+
+if __name__ == "__main__":
+    main()
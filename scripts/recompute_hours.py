@@ -0,0 +1,53 @@
+"""
+Re-derive attendance hours under the current (or an overridden) hours policy.
+
+Run from the project root:
+    python3 scripts/recompute_hours.py --start 2025-09-01 --max-session-hours 4 --dry-run
+Policy options default to the server's environment (AUTO_SIGN_OUT_HOURS,
+MAX_SESSION_HOURS, MAX_DAY_HOURS, HOURS_ROUNDING_MINUTES, CARRY_OVER_MIDNIGHT).
+Only entries whose hours or sign-out change are written.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+
+
+def main():
+    policy = server.HoursPolicy.from_env()
+    parser = argparse.ArgumentParser(description="Recompute attendance hours for a date range")
+    parser.add_argument("--start", help="First day (ISO date)")
+    parser.add_argument("--end", help="Last day (ISO date)")
+    parser.add_argument("--auto-close-hours", type=float, default=policy.auto_close_hours)
+    parser.add_argument("--max-session-hours", type=float, default=policy.max_session_hours)
+    parser.add_argument("--max-day-hours", type=float, default=policy.max_day_hours)
+    parser.add_argument("--rounding-minutes", type=float, default=policy.rounding_minutes)
+    parser.add_argument("--no-carry-over", action="store_true", default=not policy.carry_over_midnight,
+                        help="Stop crediting sessions at midnight")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+    if server.db is None:
+        print("Error: Firestore is not available.")
+        sys.exit(1)
+
+    policy = server.HoursPolicy(
+        auto_close_hours=args.auto_close_hours,
+        max_session_hours=args.max_session_hours,
+        max_day_hours=args.max_day_hours,
+        rounding_minutes=args.rounding_minutes,
+        carry_over_midnight=not args.no_carry_over
+    )
+    print(f"Policy: {policy.to_dict()}")
+    started = time.perf_counter()
+    result = server.recompute_hours(args.start, args.end, policy, dry_run=args.dry_run)
+    elapsed = time.perf_counter() - started
+    verb = "would change" if args.dry_run else "changed"
+    print(f"{result['days']} days, {result['entries']} entries, {result['sessions']} sessions; "
+          f"{verb} {result['changed']} entries in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,27 @@
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
 from datetime import date
 import os
 import sys
 
-def initialize_firebase():
-    cred_path = 'serviceAccountKey.json'
-    if os.path.exists(cred_path):
-        cred = credentials.Certificate(cred_path)
-        firebase_admin.initialize_app(cred)
-    else:
-        parent_cred_path = os.path.join('..', cred_path)
-        if os.path.exists(parent_cred_path):
-             cred = credentials.Certificate(parent_cred_path)
-             firebase_admin.initialize_app(cred)
-        else:
-            print("Error: serviceAccountKey.json not found.")
-            sys.exit(1)
-    return firestore.client()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+from server import AttendanceDay
 
 def verify_cleanup():
-    db = initialize_firebase()
-    today_str = date.today().isoformat()
-    
-    docs = db.collection('attendance').stream()
+    db = server.db
+    if db is None:
+        print("Error: Firestore is not available.")
+        sys.exit(1)
+    yesterday_str = date.fromordinal(date.today().toordinal() - 1).isoformat()
     
     issues_found = 0
     
-    for doc in docs:
-        day_str = doc.id
-        if day_str >= today_str:
-            continue
-            
-        data = doc.to_dict()
-        for uid, record in data.items():
-            if not isinstance(record, dict):
-                continue
-                
-            if record.get('signed_in', False):
+    # Past days are served from the server's local day cache when enabled
+    for day_str, data in server.iter_attendance_days(end=yesterday_str):
+        attendance_day = AttendanceDay.from_dict(day_str, data)
+        for uid, entry in attendance_day.entries.items():
+            if entry.signed_in:
                 print(f"ISSUE: {uid} is still signed in on {day_str}")
                 issues_found += 1
-            
-            if record.get('hours') == 2.0 and record.get('signed_in') is False:
-                 # This is likely one we fixed, or just happened to be 2 hours.
-                 # We can't strictly distinguish without more history, but it's a good sign.
-                 pass
 
     if issues_found == 0:
         print("Verification SUCCESS: No old sign-ins found.")
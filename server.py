@@ -1,17 +1,29 @@
 '''
 Flask Backend Server for NFC Reader Web Interface
 '''
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response, stream_with_context
 from flask_cors import CORS
 from smartcard.System import readers
 from smartcard.util import toHexString
 from smartcard.ATR import ATR
+from smartcard.Exceptions import NoCardException
 import threading
+import collections
+import unicodedata
+import bisect
+import concurrent.futures
 import time
 import queue
 import json
 import os
-from datetime import datetime, date
+import io
+import csv
+import gzip
+import hashlib
+import hmac
+import socket
+import sys
+from datetime import datetime, date, timedelta, timezone
 from dotenv import load_dotenv
 
 # Load environment variables from .env (if present). This allows using a local
@@ -20,6 +32,7 @@ import requests
 import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
 
 # Load environment variables from .env (if present). This allows using a local
 # `.env` file instead of exporting env vars manually.
@@ -27,6 +40,9 @@ load_dotenv()
 
 # Initialize Firebase
 cred_path = 'serviceAccountKey.json'
+if not os.path.exists(cred_path):
+    # Allow running helper scripts from other directories
+    cred_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serviceAccountKey.json')
 try:
     if os.path.exists(cred_path):
         cred = credentials.Certificate(cred_path)
@@ -81,9 +97,123 @@ CARD_NAME_MAP = {
     "F0 11": "FeliCa 212K/424K"
 }
 
+# ---------------------------------------------------------------------------
+# Read-path cache
+#
+# Dashboards poll the same expensive reads (full roster, today's status, whole
+# profile histories). Concurrent identical requests share one in-flight
+# computation, results are kept for a short TTL with LRU eviction, and the
+# write paths invalidate what they change. Cached values are shared between
+# callers and must be treated as read-only.
+# ---------------------------------------------------------------------------
+
+class ReadCache:
+    """Single-flight TTL/LRU cache keyed by tuples like ("profile", uid)"""
+
+    def __init__(self, ttl_seconds, max_entries):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}  # key -> threading.Event
+        self._generations = {}  # key -> invalidation count, to drop stale in-flight results
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, compute):
+        """Return the cached value for `key`, computing it at most once across threads.
+
+        Falsy results (errors are reported as None/{} by the loaders) are not cached.
+        """
+        while True:
+            with self._lock:
+                cached = self._entries.get(key)
+                if cached is not None and cached[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return cached[1]
+                waiting = self._inflight.get(key)
+                if waiting is None:
+                    self.misses += 1
+                    done = self._inflight[key] = threading.Event()
+                    generation = self._generations.get(key, 0)
+                    break
+                self.coalesced += 1
+            waiting.wait()
+            with self._lock:
+                cached = self._entries.get(key)
+                if cached is not None:
+                    self._entries.move_to_end(key)
+                    return cached[1]
+                # The leader failed or was invalidated; this lookup wasn't served by it
+                self.coalesced -= 1
+
+        value = None
+        try:
+            value = compute()
+        finally:
+            # Store and release in one step, so a woken waiter always finds the value
+            with self._lock:
+                if value and self._generations.get(key, 0) == generation:
+                    self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+                del self._inflight[key]
+                done.set()
+        return value
+
+    def invalidate(self, *keys, kind=None):
+        """Drop the given keys, or every key whose first element is `kind`"""
+        with self._lock:
+            if kind is not None:
+                keys = keys + tuple(k for k in set(self._entries) | set(self._inflight) if k[0] == kind)
+            for key in keys:
+                self._generations[key] = self._generations.get(key, 0) + 1
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "maxEntries": self.max_entries,
+                "ttlSeconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hitRate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0
+            }
+
+
+read_cache = ReadCache(
+    float(os.environ.get('READ_CACHE_TTL', '30')),
+    int(os.environ.get('READ_CACHE_SIZE', '256'))
+)
+
+
+def invalidate_attendance_reads(uid=None):
+    """Invalidate cached reads after an attendance write (for one member, or everyone)"""
+    read_cache.invalidate(kind="attendance_status")
+    if uid is None:
+        read_cache.invalidate(kind="profile")
+    else:
+        read_cache.invalidate(("profile", uid))
+
+
 def get_all_card_names():
     """Get all card names from Firestore"""
     if db is None: return {}
+    return read_cache.get(("card_names",), _load_all_card_names)
+
+def _load_all_card_names():
     try:
         docs = db.collection('card_names').stream()
         return {doc.id: doc.to_dict().get('name') for doc in docs}
@@ -109,82 +239,676 @@ def set_card_name(uid, name):
         return False
     try:
         db.collection('card_names').document(uid).set({'name': name})
+        read_cache.invalidate(("card_names",), ("profile", uid), kind="attendance_status")
+        member_search_index.update(uid, name)
+        tap_journal.remember_name(uid, name)
         return True
     except Exception as e:
         print(f"Error setting card name: {e}")
         return False
 
 
-def record_sign_in(uid):
-    """Record a sign-in for a card UID today"""
-    if uid is None or db is None:
-        return False
-    
-    today = date.today().isoformat()
-    doc_ref = db.collection('attendance').document(today)
-    
+# ---------------------------------------------------------------------------
+# Attendance model
+#
+# Day documents store ISO-8601 strings. Each entry is parsed once into epoch
+# seconds here and serialized back the same way, instead of every consumer
+# calling datetime.fromisoformat itself. Credited hours come from HoursPolicy.
+# ---------------------------------------------------------------------------
+
+def parse_timestamp(value):
+    """Parse an ISO-8601 string (naive local or with offset) to epoch seconds, or None"""
+    if not value:
+        return None
     try:
-        doc = doc_ref.get()
-        if doc.exists:
-            attendance_day = doc.to_dict()
-        else:
-            attendance_day = {}
-        
-        # If already signed in today, don't overwrite - just update sign-in time
-        if uid in attendance_day and attendance_day[uid].get("signed_in", False):
-            # Already signed in, update sign-in time
-            attendance_day[uid]["sign_in_time"] = datetime.now().isoformat()
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def format_timestamp(ts):
+    """Format epoch seconds the way the server writes them (naive local ISO-8601)"""
+    return datetime.fromtimestamp(ts).isoformat() if ts is not None else None
+
+
+def _optional_float(name):
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+def _next_midnight(ts):
+    day = date.fromtimestamp(ts) + timedelta(days=1)
+    return datetime(day.year, day.month, day.day).timestamp()
+
+
+class HoursPolicy:
+    """Rules for turning sessions into credited hours.
+
+    Sign-out, auto sign-out, the cleanup script and recompute_hours all go
+    through one policy, so a rule change can be applied to history with
+    `scripts/recompute_hours.py`. Configured from the environment:
+    `AUTO_SIGN_OUT_HOURS` (open sessions close this long after sign-in),
+    `MAX_SESSION_HOURS`, `MAX_DAY_HOURS`, `HOURS_ROUNDING_MINUTES` and
+    `CARRY_OVER_MIDNIGHT` (0 stops crediting a session at midnight).
+    """
+
+    def __init__(self, auto_close_hours=2.0, max_session_hours=None, max_day_hours=None,
+                 rounding_minutes=0, carry_over_midnight=True):
+        self.auto_close_hours = auto_close_hours
+        self.max_session_hours = max_session_hours
+        self.max_day_hours = max_day_hours
+        self.rounding_minutes = rounding_minutes
+        self.carry_over_midnight = carry_over_midnight
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            auto_close_hours=float(os.environ.get('AUTO_SIGN_OUT_HOURS', '2')),
+            max_session_hours=_optional_float('MAX_SESSION_HOURS'),
+            max_day_hours=_optional_float('MAX_DAY_HOURS'),
+            rounding_minutes=float(os.environ.get('HOURS_ROUNDING_MINUTES', '0')),
+            carry_over_midnight=os.environ.get('CARRY_OVER_MIDNIGHT', '1') != '0'
+        )
+
+    def to_dict(self):
+        return {
+            "autoCloseHours": self.auto_close_hours,
+            "maxSessionHours": self.max_session_hours,
+            "maxDayHours": self.max_day_hours,
+            "roundingMinutes": self.rounding_minutes,
+            "carryOverMidnight": self.carry_over_midnight
+        }
+
+    def auto_close_at(self, sign_in_ts):
+        """When an open session started at `sign_in_ts` is closed automatically"""
+        return sign_in_ts + self.auto_close_hours * 3600
+
+    def session_hours(self, sign_ins, sign_outs):
+        """Credited hours for parallel columns of session start and end timestamps"""
+        step = self.rounding_minutes / 60.0
+        cap = self.max_session_hours
+        hours = []
+        for start, end in zip(sign_ins, sign_outs):
+            if start is None or end is None:
+                hours.append(0)
+                continue
+            if not self.carry_over_midnight:
+                end = min(end, _next_midnight(start))
+            value = max(end - start, 0) / 3600.0
+            if step:
+                value = round(value / step) * step
+            if cap is not None:
+                value = min(value, cap)
+            hours.append(round(value, 2))
+        return hours
+
+    def cap_day(self, sessions):
+        """Trim session hours, latest first to go, so the day stays within `max_day_hours`"""
+        if self.max_day_hours is None:
+            return
+        remaining = self.max_day_hours
+        for session in sessions:
+            session[2] = round(min(session[2], max(remaining, 0)), 2)
+            remaining -= session[2]
+
+
+hours_policy = HoursPolicy.from_env()
+
+
+class AttendanceEntry:
+    """One member's attendance for one day, made up of one or more sessions.
+
+    Each session is a [sign_in_ts, sign_out_ts, hours] list; the top-level
+    fields summarize them the way older readers expect (first sign-in, last
+    sign-out, total hours).
+    """
+    __slots__ = ("uid", "sessions", "event_ids", "extra", "_raw")
+
+    def __init__(self, uid, sessions=None, event_ids=None, extra=None):
+        self.uid = uid
+        self.sessions = sessions if sessions is not None else []
+        self.event_ids = event_ids if event_ids is not None else []
+        self.extra = extra
+        self._raw = None
+
+    @classmethod
+    def from_dict(cls, uid, data):
+        extra = {k: v for k, v in data.items() if k not in ENTRY_FIELDS} or None
+        raw_sessions = data.get("sessions")
+        sessions = None
+        if raw_sessions:
+            sessions = [
+                [parse_timestamp(s.get("sign_in_time")), parse_timestamp(s.get("sign_out_time")), s.get("hours", 0) or 0]
+                for s in raw_sessions
+            ]
+            if not _sessions_match(sessions, data):
+                # The summary was edited by a writer that doesn't know about
+                # sessions (e.g. the attendance pages); the summary wins
+                data = {k: v for k, v in data.items() if k != "sessions"}
+                sessions = None
+        if sessions is None:
+            # Single-session entry written before sessions existed
+            sign_in = parse_timestamp(data.get("sign_in_time"))
+            sign_out = parse_timestamp(data.get("sign_out_time"))
+            if data.get("signed_in", False):
+                sessions = [[sign_in, None, 0]] if sign_in is not None else []
+            elif sign_in is not None and sign_out is not None:
+                sessions = [[sign_in, sign_out, data.get("hours", 0) or 0]]
+            else:
+                sessions = []
+        entry = cls(uid, sessions, list(data.get("event_ids") or []), extra)
+        if not sessions:
+            # A manual entry (hours only, or closed by an admin with no sign-out
+            # time); nothing to derive, so keep what was stored
+            entry._raw = dict(data)
         else:
-            # New sign-in
-            attendance_day[uid] = {
-                "sign_in_time": datetime.now().isoformat(),
-                "signed_in": True,
-                "sign_out_time": None,
-                "hours": 0
+            # Keep the stored strings so unchanged entries serialize back byte-for-byte
+            entry._raw = {
+                "sign_in_time": (entry.sign_in, data.get("sign_in_time")),
+                "sign_out_time": (entry.sign_out, data.get("sign_out_time"))
             }
-        
-        doc_ref.set(attendance_day)
+        return entry
+
+    @property
+    def sign_in(self):
+        if not self.sessions and self._raw is not None:
+            return parse_timestamp(self._raw.get("sign_in_time"))
+        return self.sessions[0][0] if self.sessions else None
+
+    @property
+    def sign_out(self):
+        return self.sessions[-1][1] if self.sessions else None
+
+    @property
+    def signed_in(self):
+        return bool(self.sessions) and self.sessions[-1][1] is None
+
+    @property
+    def hours(self):
+        if not self.sessions and self._raw is not None:
+            return self._raw.get("hours", 0) or 0
+        return round(sum(s[2] for s in self.sessions), 2)
+
+    @property
+    def attended(self):
+        return self.sign_in is not None
+
+    @property
+    def credited(self):
+        """Whether the entry counts toward totals: a closed session, or manual hours"""
+        if not self.sessions:
+            return bool(self.hours)
+        return any(s[1] is not None for s in self.sessions)
+
+    def _iso(self, field, ts):
+        raw = self._raw.get(field) if self._raw else None
+        if not self.sessions and raw is not None and not isinstance(raw, tuple):
+            return raw
+        if isinstance(raw, tuple) and raw[0] == ts:
+            return raw[1]
+        return format_timestamp(ts)
+
+    @property
+    def sign_in_time(self):
+        return self._iso("sign_in_time", self.sign_in)
+
+    @property
+    def sign_out_time(self):
+        return self._iso("sign_out_time", self.sign_out)
+
+    def open_session(self, sign_in_ts):
+        """Start a new session. Returns False if one is already open."""
+        if self.signed_in:
+            return False
+        if not self.sessions and self._raw is not None and self.hours:
+            # Keep manually entered hours as a closed session of that length
+            length = self.hours * 3600
+            start = self.sign_in if self.sign_in is not None else sign_in_ts - length
+            self.sessions.append([start, start + length, self.hours])
+        self.sessions.append([sign_in_ts, None, 0])
+        return True
+
+    def close(self, sign_out_ts, hours=None):
+        """Close the open session at `sign_out_ts`, crediting hours by the policy unless `hours` is given.
+
+        Returns False if no session is open.
+        """
+        if not self.signed_in:
+            return False
+        session = self.sessions[-1]
+        session[1] = sign_out_ts
+        session[2] = hours_policy.session_hours([session[0]], [sign_out_ts])[0] if hours is None else hours
+        hours_policy.cap_day(self.sessions)
+        return True
+
+    def close_automatically(self):
+        """Close the open session at the policy's auto-close time"""
+        return self.close(hours_policy.auto_close_at(self.sessions[-1][0])) if self.signed_in else False
+
+    def elapsed_hours(self, now_ts):
+        """Hours the open session has been running, or 0"""
+        return (now_ts - self.sessions[-1][0]) / 3600.0 if self.signed_in else 0
+
+    def apply_event(self, event):
+        """Apply a tap event to this entry. Returns True if it changed anything.
+
+        Events already applied (by id) are ignored, which makes replays safe.
+        """
+        event_id = event.get("event_id")
+        if event_id and event_id in self.event_ids:
+            return False
+        if event["type"] == "sign_in":
+            changed = self.open_session(event["ts"])
+        else:
+            changed = self.close(event["ts"], event.get("hours"))
+        if event_id:
+            self.event_ids.append(event_id)
+        return changed
+
+    def to_dict(self):
+        if not self.sessions and self._raw is not None:
+            return dict(self._raw)
+        data = {
+            "sign_in_time": self.sign_in_time,
+            "signed_in": self.signed_in,
+            "sign_out_time": self.sign_out_time,
+            "hours": self.hours
+        }
+        if len(self.sessions) > 1:
+            data["sessions"] = [
+                {"sign_in_time": format_timestamp(s[0]), "sign_out_time": format_timestamp(s[1]), "hours": s[2]}
+                for s in self.sessions
+            ]
+        if self.event_ids:
+            data["event_ids"] = self.event_ids
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+def _sessions_match(sessions, data):
+    """Whether an entry's top-level fields still summarize its stored sessions"""
+    def same(ts, value):
+        parsed = parse_timestamp(value)
+        return ts == parsed if ts is None or parsed is None else abs(ts - parsed) < 1
+
+    return (
+        same(sessions[0][0], data.get("sign_in_time"))
+        and same(sessions[-1][1], data.get("sign_out_time"))
+        and bool(data.get("signed_in", False)) == (sessions[-1][1] is None)
+        and abs(sum(s[2] for s in sessions) - (data.get("hours", 0) or 0)) < 0.01
+    )
+
+
+ENTRY_FIELDS = ("sign_in_time", "sign_out_time", "hours", "signed_in", "sessions", "event_ids")
+
+
+class AttendanceDay:
+    """All entries of one `attendance/<date>` document"""
+    __slots__ = ("day", "entries", "extra")
+
+    def __init__(self, day, entries=None, extra=None):
+        self.day = day
+        self.entries = entries if entries is not None else {}
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, day, data):
+        entries = {}
+        extra = None
+        for uid, value in (data or {}).items():
+            if isinstance(value, dict):
+                entries[uid] = AttendanceEntry.from_dict(uid, value)
+            else:
+                # Not a member entry; carry it through untouched
+                if extra is None:
+                    extra = {}
+                extra[uid] = value
+        return cls(day, entries, extra)
+
+    def get(self, uid):
+        return self.entries.get(uid)
+
+    def to_dict(self):
+        data = {uid: entry.to_dict() for uid, entry in self.entries.items()}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+# ---------------------------------------------------------------------------
+# Storage layout
+#
+# `ATTENDANCE_LAYOUT=day` (default) keeps every member's entry as a field of
+# the single `attendance/<date>` document. `ATTENDANCE_LAYOUT=member` writes
+# each entry to its own `attendance/<date>/members/<uid>` document instead, so
+# taps never contend on, or grow, one shared document; the day document is
+# left empty and only marks that the day exists.
+#
+# Reads handle both: an empty day document is read from its `members`
+# subcollection, and with the member layout configured a day document that
+# also has member fields (e.g. written by an older attendance page) is merged
+# with it, the member documents winning. Use
+# scripts/migrate_attendance_layout.py to move existing days between layouts.
+# ---------------------------------------------------------------------------
+
+ATTENDANCE_LAYOUT = os.environ.get('ATTENDANCE_LAYOUT', 'day')
+# Fields added to member-layout documents for collection group queries
+MEMBER_DOC_FIELDS = ("uid", "day")
+# Days whose (empty) day document is known to exist, so it is created once
+_known_member_days = set()
+
+
+def members_collection(day):
+    return db.collection('attendance').document(day).collection('members')
+
+
+def member_doc_to_entry(data):
+    """Strip the bookkeeping fields from a member-layout document"""
+    return {k: v for k, v in data.items() if k not in MEMBER_DOC_FIELDS}
+
+
+def has_member_entries(data):
+    return any(isinstance(v, dict) for v in (data or {}).values())
+
+
+def day_uses_members(data):
+    """Whether a day document's entries may be (partly) in its members subcollection"""
+    return ATTENDANCE_LAYOUT == 'member' or not has_member_entries(data)
+
+
+def read_day_data(day, data):
+    """Complete a day document's data with its members subcollection, which wins for a uid in both"""
+    if not day_uses_members(data):
+        return data
+    merged = dict(data or {})
+    for doc in members_collection(day).stream():
+        merged[doc.id] = member_doc_to_entry(doc.to_dict())
+    return merged
+
+
+def _ensure_member_day(day):
+    if day in _known_member_days:
+        return
+    try:
+        db.collection('attendance').document(day).create({})
+    except AlreadyExists:
+        pass
+    _known_member_days.add(day)
+
+
+def load_attendance_day(day):
+    """Read one day into an AttendanceDay (empty if it doesn't exist), in either layout"""
+    doc = db.collection('attendance').document(day).get()
+    data = doc.to_dict() if doc.exists else {}
+    return AttendanceDay.from_dict(day, read_day_data(day, data))
+
+
+def save_attendance_day(attendance_day):
+    batch = db.batch()
+    if ATTENDANCE_LAYOUT == 'member':
+        _ensure_member_day(attendance_day.day)
+        members = members_collection(attendance_day.day)
+        for uid, entry in attendance_day.entries.items():
+            data = entry.to_dict()
+            data.update({"uid": uid, "day": attendance_day.day})
+            batch.set(members.document(uid), data)
+    else:
+        batch.set(db.collection('attendance').document(attendance_day.day), attendance_day.to_dict())
+    queue_day_changed(batch, attendance_day.day)
+    batch.commit()
+    # Only after the commit, so a concurrent read can't re-cache the old data
+    invalidate_attendance_reads()
+    season_summary.invalidate()
+
+
+def load_attendance_entry(day, uid):
+    """Read one member's entry for a day without downloading the rest of the day"""
+    if ATTENDANCE_LAYOUT == 'member':
+        doc = members_collection(day).document(uid).get()
+        if doc.exists:
+            return AttendanceEntry.from_dict(uid, member_doc_to_entry(doc.to_dict()))
+        # Fall through: the day may still be in the day layout
+    doc = db.collection('attendance').document(day).get(field_paths=[firestore.FieldPath(uid).to_api_repr()])
+    data = doc.to_dict() if doc.exists else None
+    raw = (data or {}).get(uid)
+    if isinstance(raw, dict):
+        return AttendanceEntry.from_dict(uid, raw)
+    if ATTENDANCE_LAYOUT != 'member' and doc.exists:
+        # The day may have been migrated to the member layout
+        member = members_collection(day).document(uid).get()
+        if member.exists:
+            return AttendanceEntry.from_dict(uid, member_doc_to_entry(member.to_dict()))
+    return None
+
+
+def queue_entry_write(batch, day, entry):
+    """Queue the write of one member's entry on `batch`"""
+    if ATTENDANCE_LAYOUT == 'member':
+        _ensure_member_day(day)
+        data = entry.to_dict()
+        data.update({"uid": entry.uid, "day": day})
+        batch.set(members_collection(day).document(entry.uid), data)
+    else:
+        # Replace the entry's map whole; merge=True would deep-merge it and keep stale keys such as `sessions`
+        batch.set(db.collection('attendance').document(day), {entry.uid: entry.to_dict()},
+                  merge=[firestore.FieldPath(entry.uid).to_api_repr()])
+
+
+def save_attendance_entry(day, entry):
+    """Write one member's entry, leaving everyone else's untouched"""
+    batch = db.batch()
+    queue_entry_write(batch, day, entry)
+    if day != date.today().isoformat():
+        queue_day_changed(batch, day)
+    batch.commit()
+    invalidate_attendance_reads(entry.uid)
+
+
+def iter_member_entries(uid):
+    """Yield (day, entry dict) for every member-layout entry of one member.
+
+    Needs the collection group single-field index on `members.uid`.
+    """
+    for doc in db.collection_group('members').where('uid', '==', uid).stream():
+        data = doc.to_dict()
+        yield data.get("day"), member_doc_to_entry(data)
+
+
+# ---------------------------------------------------------------------------
+# Tap event log
+#
+# Every sign-in and sign-out is appended to `attendance_events` as a small,
+# immutable document whose id makes the append idempotent. The per-day
+# documents in `attendance` are a materialized view derived from those events:
+# each new event is applied to the member's entry and only that entry is
+# written back.
+# ---------------------------------------------------------------------------
+
+def make_event_id(uid, event_type, ts):
+    """Deterministic id for a tap, so retrying the same tap never appends twice"""
+    return f"{uid.replace(' ', '')}-{event_type}-{int(ts * 1000)}"
+
+
+def make_tap_event(uid, event_type, ts=None, event_id=None, source="reader", hours=None, day=None):
+    """Build the event document for a tap.
+
+    `day` defaults to the tap's local date; an automatic close passes the day
+    of the session it closes, which may be before the close time's date.
+    """
+    ts = time.time() if ts is None else ts
+    event = {
+        "event_id": event_id or make_event_id(uid, event_type, ts),
+        "uid": uid,
+        "type": event_type,
+        "ts": ts,
+        "day": day or date.fromtimestamp(ts).isoformat(),
+        "source": source
+    }
+    if hours is not None:
+        event["hours"] = hours
+    return event
+
+
+def append_tap_event(uid, event_type, ts=None, event_id=None, source="reader", hours=None, day=None):
+    """Append a tap event and apply it to the day's materialized entry.
+
+    Returns True if the event changed the member's attendance (a sign-out
+    without an open session, or a sign-in while already signed in, does not).
+    """
+    event = make_tap_event(uid, event_type, ts, event_id, source, hours, day)
+    day = event["day"]
+
+    try:
+        db.collection('attendance_events').document(event["event_id"]).create(event)
+    except AlreadyExists:
+        # Already logged by an earlier attempt; still make sure the view has it
+        pass
+
+    entry = load_attendance_entry(day, uid) or AttendanceEntry(uid)
+    if event["event_id"] in entry.event_ids:
+        return False
+    changed = entry.apply_event(event)
+    save_attendance_entry(day, entry)
+    tap_journal.note(day, uid, entry.signed_in)
+    if changed and event_type == "sign_out":
+        season_summary.record_session(uid, day, entry.sessions[-1][2])
+    return changed
+
+
+def iter_tap_events(day):
+    """Yield the logged events for one day in time order"""
+    # Sorted here rather than with order_by, which would need a composite index
+    events = [doc.to_dict() for doc in db.collection('attendance_events').where('day', '==', day).stream()]
+    events.sort(key=lambda e: e["ts"])
+    yield from events
+
+
+# Serializes batches relayed by edge kiosks, which may touch the same entries
+tap_batch_lock = threading.Lock()
+
+
+def apply_tap_batch(taps):
+    """Apply a batch of taps relayed from an edge kiosk, in time order, once each.
+
+    Taps are grouped per member and day so each entry is read once, and all the
+    entries are written back in one batch. A tap older than what its entry already reflects (e.g. from a kiosk that was
+    offline) replays that member's whole day from the event log instead.
+    Returns the number of taps that were new.
+    """
+    events = sorted(
+        (make_tap_event(t["uid"], t["type"], t["ts"], t.get("event_id"), t.get("source", "reader")) for t in taps),
+        key=lambda e: e["ts"]
+    )
+    # Logging an event again on a resend rewrites the same document
+    for chunk in _chunked(events, 500):
+        batch = db.batch()
+        for event in chunk:
+            batch.set(db.collection('attendance_events').document(event["event_id"]), event)
+        batch.commit()
+
+    groups = {}
+    for event in events:
+        groups.setdefault((event["day"], event["uid"]), []).append(event)
+
+    applied = 0
+    with tap_batch_lock:
+        updates = []  # (day, entry, rebuilt, hours of each closed session)
+        for (day, uid), group in groups.items():
+            entry = load_attendance_entry(day, uid) or AttendanceEntry(uid)
+            new = [e for e in group if e["event_id"] not in entry.event_ids]
+            if not new:
+                continue
+            applied += len(new)
+            latest = max((t for session in entry.sessions for t in session[:2] if t is not None), default=0)
+            rebuilt = new[0]["ts"] < latest
+            closed = []
+            if rebuilt:
+                entry = AttendanceEntry(uid, extra=entry.extra)
+                for event in iter_tap_events(day):
+                    if event["uid"] == uid:
+                        entry.apply_event(event)
+            else:
+                for event in new:
+                    if entry.apply_event(event) and event["type"] == "sign_out":
+                        closed.append(entry.sessions[-1][2])
+            updates.append((day, entry, rebuilt, closed))
+
+        # All touched entries go out in as few commits as possible
+        today = date.today().isoformat()
+        for chunk in _chunked(updates, 200):
+            batch = db.batch()
+            for day, entry, _, _ in chunk:
+                queue_entry_write(batch, day, entry)
+            for day in {day for day, _, _, _ in chunk if day != today}:
+                queue_day_changed(batch, day)
+            batch.commit()
+        for day, entry, rebuilt, closed in updates:
+            invalidate_attendance_reads(entry.uid)
+            tap_journal.note(day, entry.uid, entry.signed_in)
+            if rebuilt:
+                season_summary.invalidate()
+            for hours in closed:
+                season_summary.record_session(entry.uid, day, hours)
+    return applied
+
+
+def rebuild_day_from_events(day):
+    """Re-derive a day's member entries from the event log.
+
+    Entries of members with no logged events (e.g. history from before the log
+    existed, or manual edits) are left as they are.
+    """
+    attendance_day = load_attendance_day(day)
+    rebuilt = {}
+    for event in iter_tap_events(day):
+        entry = rebuilt.get(event["uid"])
+        if entry is None:
+            existing = attendance_day.get(event["uid"])
+            entry = rebuilt[event["uid"]] = AttendanceEntry(event["uid"], extra=existing.extra if existing else None)
+        entry.apply_event(event)
+    attendance_day.entries.update(rebuilt)
+    save_attendance_day(attendance_day)
+    return len(rebuilt)
+
+
+def record_sign_in(uid, ts=None, event_id=None, source="reader"):
+    """Record a sign-in for a card UID today.
+
+    Signing in again while already signed in keeps the open session; signing
+    in after signing out starts a new session for the same day.
+    """
+    if uid is None:
+        return False
+    if CENTRAL_URL:
+        # Edge kiosks hand every write to the central server
+        tap_journal.append(uid, "sign_in", source, ts, event_id)
+        return True
+    if db is None:
+        return False
+    
+    try:
+        append_tap_event(uid, "sign_in", ts, event_id, source)
         return True
     except Exception as e:
         print(f"Error recording sign in: {e}")
         return False
 
 
-def record_sign_out(uid):
+def record_sign_out(uid, ts=None, event_id=None, source="reader", hours=None):
     """Record a sign-out for a card UID today and calculate hours"""
-    if uid is None or db is None:
+    if uid is None:
         return False
-    
-    today = date.today().isoformat()
-    doc_ref = db.collection('attendance').document(today)
-    
-    try:
-        doc = doc_ref.get()
-        if not doc.exists:
-            return False
-            
-        attendance_day = doc.to_dict()
-        
-        if uid not in attendance_day:
+    if CENTRAL_URL:
+        if tap_journal.signed_in(uid, date.fromtimestamp(ts).isoformat() if ts else None) is False:
             return False
-        
-        if not attendance_day[uid].get("signed_in", False):
-            return False
-        
-        sign_out_time = datetime.now()
-        sign_in_time_str = attendance_day[uid].get("sign_in_time")
-        
-        if sign_in_time_str:
-            sign_in_time = datetime.fromisoformat(sign_in_time_str)
-            time_diff = sign_out_time - sign_in_time
-            hours = time_diff.total_seconds() / 3600.0  # Convert to hours
-            
-            attendance_day[uid]["sign_out_time"] = sign_out_time.isoformat()
-            attendance_day[uid]["hours"] = round(hours, 2)
-            attendance_day[uid]["signed_in"] = False
-        
-        doc_ref.set(attendance_day)
+        tap_journal.append(uid, "sign_out", source, ts, event_id)
         return True
+    if db is None:
+        return False
+    
+    try:
+        return append_tap_event(uid, "sign_out", ts, event_id, source, hours)
     except Exception as e:
         print(f"Error recording sign out: {e}")
         return False
@@ -194,61 +918,408 @@ def has_signed_in_today(uid):
     if uid is None or db is None:
         return False
     
-    today = date.today().isoformat()
     try:
-        doc = db.collection('attendance').document(today).get()
-        if not doc.exists:
-            return False
-        
-        attendance_day = doc.to_dict()
-        return uid in attendance_day and attendance_day[uid].get("signed_in", False)
+        entry = load_attendance_entry(date.today().isoformat(), uid)
+        return entry is not None and entry.signed_in
     except Exception as e:
         print(f"Error checking sign in status: {e}")
         return False
 
 def get_attendance_status():
     """Get attendance status for all registered cards for today"""
+    # Keyed by date so the cached status never outlives the day it describes
+    return read_cache.get(("attendance_status", date.today().isoformat()), _compute_attendance_status)
+
+def _compute_attendance_status():
     card_names = get_all_card_names()
-    today = date.today().isoformat()
     
-    attendance_day = {}
+    attendance_day = AttendanceDay(date.today().isoformat())
     if db:
         try:
-            doc = db.collection('attendance').document(today).get()
-            if doc.exists:
-                attendance_day = doc.to_dict()
+            attendance_day = load_attendance_day(attendance_day.day)
         except Exception as e:
             print(f"Error getting attendance status: {e}")
     
     status_list = []
     for uid, name in card_names.items():
-        has_signed_in = uid in attendance_day and attendance_day[uid].get("signed_in", False)
-        sign_in_time = None
-        sign_out_time = None
-        hours = 0
-        
-        if uid in attendance_day:
-            entry = attendance_day[uid]
-            sign_in_time = entry.get("sign_in_time")
-            sign_out_time = entry.get("sign_out_time")
-            hours = entry.get("hours", 0)
-        
+        entry = attendance_day.get(uid)
         status_list.append({
             "uid": uid,
             "name": name,
-            "signedIn": has_signed_in,
-            "signInTime": sign_in_time,
-            "signOutTime": sign_out_time,
-            "hours": hours
+            "signedIn": entry is not None and entry.signed_in,
+            "signInTime": entry.sign_in_time if entry else None,
+            "signOutTime": entry.sign_out_time if entry else None,
+            "hours": entry.hours if entry else 0
         })
     
     return status_list
 
+
+def validate_attendance_entry(day, uid, entry):
+    """Check one attendance entry for import. Returns a list of problems (empty if valid)."""
+    problems = []
+    try:
+        date.fromisoformat(day)
+    except (TypeError, ValueError):
+        problems.append(f"invalid date {day!r}")
+    if not isinstance(uid, str) or not uid.strip():
+        problems.append(f"invalid uid {uid!r}")
+    if not isinstance(entry, dict):
+        return problems + ["entry is not an object"]
+
+    for field in ("sign_in_time", "sign_out_time"):
+        value = entry.get(field)
+        if value is None:
+            continue
+        try:
+            datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            problems.append(f"invalid {field} {value!r}")
+    hours = entry.get("hours", 0)
+    if isinstance(hours, bool) or not isinstance(hours, (int, float)) or hours < 0:
+        problems.append(f"invalid hours {hours!r}")
+    if not isinstance(entry.get("signed_in", False), bool):
+        problems.append(f"invalid signed_in {entry.get('signed_in')!r}")
+    if entry.get("signed_in") and not entry.get("sign_in_time"):
+        problems.append("signed in without a sign_in_time")
+    return problems
+
+
+# ---------------------------------------------------------------------------
+# Past-day cache
+#
+# Once a day is over its attendance document almost never changes, so the
+# full-history readers keep finalized days on local disk. Every write to a day
+# stamps `attendance_changes/<date>` with a server timestamp in the same batch
+# as the data; a sync only fetches today, days newer than the newest cached
+# day, days fetched while they were still today, and days stamped since the
+# last sync. Tap writes to today skip the stamp (today is always read fresh),
+# so the tap path pays nothing for this.
+#
+# Only per-day metadata is kept in memory; day data stays in one file per day
+# and is read back as it is iterated.
+#
+# Set `DAY_CACHE_DIR` to choose the directory, or to an empty string to disable.
+# ---------------------------------------------------------------------------
+
+def queue_day_changed(batch, day):
+    """Stamp a day as changed on `batch`, so caches refetch it once the batch commits"""
+    batch.set(db.collection('attendance_changes').document(day), {"updated_at": firestore.SERVER_TIMESTAMP})
+
+
+# Overlap between readers' cursors, so stamps committed during a read aren't missed
+CHANGE_CURSOR_MARGIN_SECONDS = 300
+
+
+def iter_day_changes(cursor):
+    """Yield (day, stamp) for change stamps newer than `cursor` (epoch seconds), less the margin.
+
+    Stamps within the margin come back again; callers compare them with what they already have.
+    """
+    since = datetime.fromtimestamp(cursor - CHANGE_CURSOR_MARGIN_SECONDS, tz=timezone.utc)
+    for marker in db.collection('attendance_changes').where('updated_at', '>', since).stream():
+        updated_at = marker.to_dict().get("updated_at")
+        yield marker.id, updated_at.timestamp() if hasattr(updated_at, "timestamp") else time.time()
+
+
+class DayDocumentCache:
+    """Persistent cache of finalized attendance days"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.days = None  # date -> {"final": bool, "changed_at": float}, loaded lazily
+        self.cursor = None  # epoch seconds of the newest change stamp seen
+        self.stats = {"syncs": 0, "fetched": 0, "served": 0}
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _day_path(self, day):
+        return self._path(os.path.join("days", f"{day}.json"))
+
+    def _write_json(self, name, value):
+        tmp = self._path(name + ".tmp")
+        with open(tmp, 'w') as f:
+            json.dump(value, f, default=str)
+        os.replace(tmp, self._path(name))
+
+    def _load(self):
+        os.makedirs(self._path("days"), exist_ok=True)
+        self.days = {}
+        index = {}
+        index_path = self._path("index.json")
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+        self.cursor = index.get("cursor")
+        if "days" in index:
+            self.days = {day: meta for day, meta in index["days"].items() if os.path.exists(self._day_path(day))}
+            return
+        # Caches written before the index held metadata: read it from each file once
+        for filename in os.listdir(self._path("days")):
+            if filename.endswith(".json"):
+                with open(self._path(os.path.join("days", filename))) as f:
+                    entry = json.load(f)
+                self.days[filename[:-5]] = {"final": entry["final"], "changed_at": entry.get("changed_at", 0)}
+
+    def _store(self, day, data, today, changed_at=0):
+        meta = {"final": day < today, "changed_at": changed_at}
+        self._write_json(os.path.join("days", f"{day}.json"), dict(meta, data=data))
+        self.days[day] = meta
+        self.stats["fetched"] += 1
+
+    def _drop(self, day):
+        if self.days.pop(day, None) is not None:
+            try:
+                os.remove(self._day_path(day))
+            except FileNotFoundError:
+                pass
+
+    def _read(self, day):
+        try:
+            with open(self._day_path(day)) as f:
+                return json.load(f)["data"]
+        except FileNotFoundError:
+            return None
+
+    def _refetch(self, days, today, changed):
+        refs = [db.collection('attendance').document(day) for day in days]
+        for snap in db.get_all(refs):
+            if snap.exists:
+                self._store(snap.id, read_day_data(snap.id, snap.to_dict() or {}), today, changed.get(snap.id, 0))
+            else:
+                self._drop(snap.id)
+
+    def sync(self):
+        """Bring the cache up to date with as few document reads as possible.
+
+        Returns the days whose data changed, or None after a first full pass.
+        """
+        with self.lock:
+            if self.days is None:
+                self._load()
+            today = date.today().isoformat()
+            sync_started = time.time()
+            changed = {}
+
+            if self.cursor is None:
+                # First run: one full pass
+                for doc in db.collection('attendance').stream():
+                    self._store(doc.id, read_day_data(doc.id, doc.to_dict() or {}), today)
+                new_cursor = sync_started
+                changed = None
+            else:
+                stale = {day for day, meta in self.days.items() if not meta["final"] and day < today}
+                new_cursor = self.cursor
+                for day, stamp in iter_day_changes(self.cursor):
+                    new_cursor = max(new_cursor, stamp)
+                    cached = self.days.get(day)
+                    if cached is None or cached.get("changed_at", 0) < stamp:
+                        stale.add(day)
+                        changed[day] = stamp
+
+                # Days created since the newest cached day
+                collection = db.collection('attendance')
+                query = collection.order_by(firestore.FieldPath.document_id())
+                newest = max(self.days) if self.days else None
+                if newest:
+                    query = query.where(firestore.FieldPath.document_id(), '>', collection.document(newest))
+                for doc in query.stream():
+                    stale.discard(doc.id)
+                    self._store(doc.id, read_day_data(doc.id, doc.to_dict() or {}), today)
+
+                stale.discard(today)
+                if stale:
+                    self._refetch(sorted(stale), today, changed)
+
+            self.cursor = new_cursor
+            self._write_json("index.json", {"cursor": self.cursor, "days": self.days})
+            self.stats["syncs"] += 1
+            return changed
+
+    def iter_days(self, start=None, end=None):
+        """Yield (date, data) in date order, reading each cached day from disk as it is reached.
+
+        Today is always read fresh from Firestore.
+        """
+        self.sync()
+        today = date.today().isoformat()
+        with self.lock:
+            days = sorted(day for day in self.days
+                          if not (start and day < start) and not (end and day > end) and day != today)
+        include_today = not (start and today < start) and not (end and today > end)
+        if include_today:
+            doc = db.collection('attendance').document(today).get()
+            if doc.exists:
+                days.append(today)
+        for day in days:
+            if day == today:
+                data = read_day_data(today, doc.to_dict() or {})
+            else:
+                data = self._read(day)
+                if data is None:
+                    continue
+            with self.lock:
+                self.stats["served"] += 1
+            yield day, data
+
+
+day_cache = DayDocumentCache(os.environ.get(
+    'DAY_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'attendance')
+))
+
+
+def iter_attendance_days(start=None, end=None, page_size=100):
+    """Yield (date, data) for attendance day documents in date order.
+
+    `start` and `end` are inclusive ISO dates. Days come one at a time, from
+    the past-day cache's files or one Firestore page at a time when the cache
+    is disabled, so memory stays flat regardless of how much history exists.
+    """
+    if db is None:
+        return
+    if day_cache.enabled:
+        yield from day_cache.iter_days(start, end)
+        return
+    collection = db.collection('attendance')
+    query = collection.order_by(firestore.FieldPath.document_id())
+    if start:
+        query = query.where(firestore.FieldPath.document_id(), '>=', collection.document(start))
+    if end:
+        query = query.where(firestore.FieldPath.document_id(), '<=', collection.document(end))
+
+    last = None
+    while True:
+        page = query.limit(page_size)
+        if last is not None:
+            page = page.start_after(last)
+        docs = list(page.stream())
+        for doc in docs:
+            yield doc.id, read_day_data(doc.id, doc.to_dict() or {})
+        if len(docs) < page_size:
+            return
+        last = docs[-1]
+
+
+EXPORT_COLUMNS = ["date", "uid", "name", "sign_in_time", "sign_out_time", "hours", "signed_in"]
+
+
+def iter_attendance_rows(start=None, end=None, uid=None, card_names=None):
+    """Yield one export row per attendance entry, joined with card names"""
+    if card_names is None:
+        card_names = get_all_card_names()
+    for day, data in iter_attendance_days(start, end):
+        if uid is not None:
+            entries = [(uid, data[uid])] if uid in data else []
+        else:
+            entries = sorted(data.items())
+        for entry_uid, entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            yield {
+                "date": day,
+                "uid": entry_uid,
+                "name": card_names.get(entry_uid),
+                "sign_in_time": entry.get("sign_in_time"),
+                "sign_out_time": entry.get("sign_out_time"),
+                "hours": entry.get("hours", 0),
+                "signed_in": entry.get("signed_in", False)
+            }
+
+
+def _chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_export_csv(rows, chunk_rows=500):
+    """Encode export rows as CSV, yielding one string per chunk of rows"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for chunk in _chunked(rows, chunk_rows):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class _StreamSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain.
+
+    Unlike truncating a BytesIO, `tell()` keeps counting from the start of the
+    stream, which the Parquet footer offsets depend on.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._position += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_export_parquet(rows, chunk_rows=5000):
+    """Encode export rows as Parquet, yielding bytes as each row group is written.
+
+    Requires the optional `pyarrow` package.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("date", pa.string()),
+        ("uid", pa.string()),
+        ("name", pa.string()),
+        ("sign_in_time", pa.string()),
+        ("sign_out_time", pa.string()),
+        ("hours", pa.float64()),
+        ("signed_in", pa.bool_())
+    ])
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for chunk in _chunked(rows, chunk_rows):
+        for row in chunk:
+            row["hours"] = float(row["hours"] or 0)
+        writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
 def get_person_profile(uid):
     """Get complete profile data for a person including all attendance history"""
     if uid is None or db is None:
         return None
+    return read_cache.get(("profile", uid), lambda: _compute_person_profile(uid))
 
+def _compute_person_profile(uid):
     name = get_card_name(uid) or uid
     
     # Get all attendance records for this person
@@ -257,42 +1328,40 @@ def get_person_profile(uid):
     days_attended = 0
     
     try:
-        # Query all attendance documents
-        # This might be slow if there are many days. 
-        # Optimization: Query only documents where this UID exists? 
-        # Firestore doesn't easily support "documents where field key X exists" without a map structure query which is tricky.
-        # But we can stream all days.
-        docs = db.collection('attendance').stream()
-        
-        # Sort docs by ID (date)
-        all_docs = sorted(list(docs), key=lambda x: x.id, reverse=True)
-        total_days = len(all_docs)
+        if day_cache.enabled:
+            # Past days come from the local cache; only changes are fetched
+            day_entries = [(day, data.get(uid)) for day, data in iter_attendance_days()]
+            day_entries.reverse()
+        else:
+            docs = sorted(db.collection('attendance').stream(), key=lambda x: x.id, reverse=True)
+            # Days in the member layout have empty day documents; fetch just this
+            # member's entries for them with one collection group query
+            member_entries = {}
+            if any(day_uses_members(doc.to_dict()) for doc in docs):
+                member_entries = dict(iter_member_entries(uid))
+            day_entries = []
+            for doc in docs:
+                data = doc.to_dict()
+                member_entry = member_entries.get(doc.id) if day_uses_members(data) else None
+                day_entries.append((doc.id, member_entry or data.get(uid)))
+        total_days = len(day_entries)
         
-        for doc in all_docs:
-            day = doc.id
-            data = doc.to_dict()
-            
-            if uid in data:
-                entry = data[uid]
-                sign_in_time = entry.get("sign_in_time")
-                sign_out_time = entry.get("sign_out_time")
-                hours = entry.get("hours", 0)
-                signed_in = entry.get("signed_in", False)
-                
-                attended = sign_in_time is not None
-                
+        for day, raw_entry in day_entries:
+            if isinstance(raw_entry, dict):
+                # Only this member's entry is parsed, not the whole day
+                entry = AttendanceEntry.from_dict(uid, raw_entry)
                 attendance_history.append({
                     "date": day,
-                    "signInTime": sign_in_time,
-                    "signOutTime": sign_out_time,
-                    "hours": hours,
-                    "signedIn": signed_in,
-                    "attended": attended
+                    "signInTime": entry.sign_in_time,
+                    "signOutTime": entry.sign_out_time,
+                    "hours": entry.hours,
+                    "signedIn": entry.signed_in,
+                    "attended": entry.attended
                 })
                 
-                if attended:
+                if entry.attended:
                     days_attended += 1
-                    total_hours += hours
+                    total_hours += entry.hours
             else:
                 # Day exists but person didn't attend
                 attendance_history.append({
@@ -325,78 +1394,1218 @@ def get_person_profile(uid):
         "attendanceHistory": attendance_history
     }
 
-def get_fresh_connection():
-    """Get a fresh connection to the NFC reader"""
-    global nfc_reader
-    if nfc_reader is None:
-        r = readers()
-        if len(r) < 1:
+
+# ---------------------------------------------------------------------------
+# Season summary and leaderboard
+#
+# Per-member totals for the current season are materialized in memory: built
+# once from history on first use, then updated by every sign-out (manual,
+# reader or automatic) so leaderboard requests never rescan attendance. Reads
+# check, at most every SEASON_CHECK_SECONDS, whether the season rolled over or
+# a day of it was stamped in `attendance_changes` by another writer (cleanup,
+# recompute, imports, restores, page edits), and rebuild if so.
+# ---------------------------------------------------------------------------
+
+def season_bounds(day):
+    """(start, end) dates of the season containing `day` (a date).
+
+    Seasons last a year from the month and day of `SEASON_START` (an ISO date
+    or MM-DD; any year in it is ignored), September 1st by default.
+    """
+    configured = os.environ.get('SEASON_START')
+    month, dom = (int(configured[-5:-3]), int(configured[-2:])) if configured else (9, 1)
+    year = day.year if (day.month, day.day) >= (month, dom) else day.year - 1
+    return date(year, month, dom), date(year + 1, month, dom) - timedelta(days=1)
+
+
+def default_season_start(today=None):
+    """Start of the current season, as an ISO date"""
+    return season_bounds(today or date.today())[0].isoformat()
+
+
+class MemberSeason:
+    __slots__ = ("uid", "hours", "days", "last_day", "streak")
+
+    def __init__(self, uid):
+        self.uid = uid
+        self.hours = 0.0
+        self.days = set()
+        self.last_day = None
+        self.streak = 0
+
+
+class SeasonSummary:
+    """Ranked per-member season totals.
+
+    Rankings are kept as sorted lists of (-value, uid) keys, so rank lookups
+    are a bisect (O(log n)) and top-K is a slice. A member counts as having
+    attended a day once one of their sessions that day is closed.
+    """
+
+    def __init__(self, season_start):
+        self.season_start = season_start
+        self.members = {}
+        self.meeting_days = []  # sorted ISO dates with at least one closed session
+        self.by_hours = []
+        self.by_days = []
+        self.built = False
+        self.built_at = 0  # epoch seconds when the last build started
+        self.checked_at = 0
+        self.lock = threading.Lock()
+
+    def _previous_meeting_day(self, day):
+        i = bisect.bisect_left(self.meeting_days, day)
+        return self.meeting_days[i - 1] if i > 0 else None
+
+    def _add_meeting_day(self, day):
+        i = bisect.bisect_left(self.meeting_days, day)
+        if i == len(self.meeting_days) or self.meeting_days[i] != day:
+            self.meeting_days.insert(i, day)
+
+    def _rank_keys(self, member):
+        return (-round(member.hours, 2), member.uid), (-len(member.days), member.uid)
+
+    def _credit(self, uid, day, hours):
+        """Add a closed session's hours to a member (caller holds the lock)"""
+        if day < self.season_start:
+            return
+        member = self.members.get(uid)
+        if member is None:
+            member = self.members[uid] = MemberSeason(uid)
+        else:
+            hours_key, days_key = self._rank_keys(member)
+            del self.by_hours[bisect.bisect_left(self.by_hours, hours_key)]
+            del self.by_days[bisect.bisect_left(self.by_days, days_key)]
+
+        self._add_meeting_day(day)
+        member.hours += hours
+        if day not in member.days:
+            member.days.add(day)
+            if member.last_day is None or day > member.last_day:
+                previous = self._previous_meeting_day(day)
+                member.streak = member.streak + 1 if previous is not None and previous == member.last_day else 1
+                member.last_day = day
+
+        hours_key, days_key = self._rank_keys(member)
+        bisect.insort(self.by_hours, hours_key)
+        bisect.insort(self.by_days, days_key)
+
+    def build(self):
+        """Rebuild from stored history (one scan of the season's days)"""
+        with self.lock:
+            self.built_at = time.time()
+            self.members = {}
+            self.meeting_days = []
+            self.by_hours = []
+            self.by_days = []
+            for day, data in iter_attendance_days(start=self.season_start):
+                for uid, entry in AttendanceDay.from_dict(day, data).entries.items():
+                    # Open sessions are credited by record_session when they close
+                    if entry.credited:
+                        self._credit(uid, day, entry.hours)
+            self.built = True
+
+    def ensure_built(self):
+        now = time.time()
+        if self.built and now - self.checked_at < SEASON_CHECK_SECONDS:
+            return
+        self.checked_at = now
+        current = default_season_start()
+        if current != self.season_start:
+            # A new season started; credits for it must not include the old one
+            self.season_start = current
+            self.built = False
+        elif self.built and any(day >= self.season_start and stamp > self.built_at
+                                for day, stamp in iter_day_changes(self.built_at)):
+            self.built = False
+        if not self.built:
+            self.build()
+
+    def invalidate(self):
+        """Mark the summary stale after a bulk rewrite; it is rebuilt on next use"""
+        self.built = False
+
+    def record_session(self, uid, day, hours):
+        """Credit a closed session; called from the sign-out write path"""
+        with self.lock:
+            if self.built:
+                self._credit(uid, day, hours)
+
+    def _current_streak(self, member):
+        # A streak is current if the member attended the latest meeting day, or
+        # the one before it while today's meeting is still in progress
+        if not self.meeting_days or member.last_day is None:
+            return 0
+        latest = self.meeting_days[-1]
+        if member.last_day == latest:
+            return member.streak
+        if latest == date.today().isoformat() and member.last_day == self._previous_meeting_day(latest):
+            return member.streak
+        return 0
+
+    def _row(self, member, rank, names):
+        return {
+            "rank": rank,
+            "uid": member.uid,
+            "name": names.get(member.uid) or member.uid,
+            "totalHours": round(member.hours, 2),
+            "daysAttended": len(member.days),
+            "currentStreak": self._current_streak(member)
+        }
+
+    def top(self, k, by="hours", names=None):
+        names = names or {}
+        with self.lock:
+            ranking = self.by_hours if by == "hours" else self.by_days
+            return [self._row(self.members[uid], i + 1, names) for i, (_, uid) in enumerate(ranking[:k])]
+
+    def rank_of(self, uid, by="hours", names=None):
+        names = names or {}
+        with self.lock:
+            member = self.members.get(uid)
+            if member is None:
+                return None
+            ranking = self.by_hours if by == "hours" else self.by_days
+            key = self._rank_keys(member)[0 if by == "hours" else 1]
+            return self._row(member, bisect.bisect_left(ranking, key) + 1, names)
+
+    def info(self):
+        with self.lock:
+            return {
+                "seasonStart": self.season_start,
+                "members": len(self.members),
+                "meetingDays": len(self.meeting_days)
+            }
+
+
+SEASON_CHECK_SECONDS = float(os.environ.get('SEASON_CHECK_SECONDS', '30'))
+
+season_summary = SeasonSummary(default_season_start())
+
+
+# ---------------------------------------------------------------------------
+# Rollups
+#
+# `attendance_rollups` holds one document per ISO week, calendar month and
+# season: {"kind", "start", "end", "days": {date: {uid: hours}}}. Taps never
+# touch them: a periodic job rolls up each day once it is over, plus any past
+# day stamped in `attendance_changes` since its last run, and records how far
+# it got in `attendance_rollups/_state`. Range queries cover the range with
+# the fewest, largest buckets (a season, then months, then weeks), so a
+# year-long chart reads a dozen or so documents instead of every day; today
+# and anything the job hasn't reached yet are read live.
+# `scripts/rebuild_rollups.py` regenerates the buckets from attendance.
+# ---------------------------------------------------------------------------
+
+ROLLUP_KINDS = ("season", "month", "week")
+ROLLUP_INTERVAL_SECONDS = float(os.environ.get('ROLLUP_INTERVAL_SECONDS', '300'))
+
+
+def rollup_bucket(kind, day):
+    """(bucket id, start, end) of the `kind` bucket containing `day` (a date)"""
+    if kind == "week":
+        start = day - timedelta(days=day.weekday())
+        year, week, _ = day.isocalendar()
+        return f"week-{year}-W{week:02d}", start, start + timedelta(days=6)
+    if kind == "month":
+        start = day.replace(day=1)
+        following = (start + timedelta(days=32)).replace(day=1)
+        return f"month-{start.strftime('%Y-%m')}", start, following - timedelta(days=1)
+    start, end = season_bounds(day)
+    return f"season-{start.isoformat()}", start, end
+
+
+def _rollup_targets(day):
+    day = date.fromisoformat(day)
+    for kind in ROLLUP_KINDS:
+        bucket_id, start, end = rollup_bucket(kind, day)
+        yield db.collection('attendance_rollups').document(bucket_id), {
+            "kind": kind, "start": start.isoformat(), "end": end.isoformat()
+        }
+
+
+def rollup_contributions(attendance_day):
+    """Hours per member for one day, counted by the same rule as the season summary"""
+    return {uid: round(entry.hours, 2) for uid, entry in attendance_day.entries.items() if entry.credited}
+
+
+def add_rollup_day(batch, day, contributions):
+    """Queue the rollup updates replacing a whole day on `batch`"""
+    for ref, meta in _rollup_targets(day):
+        # Clear the day first so members no longer on it drop out
+        batch.set(ref, {"days": {day: firestore.DELETE_FIELD}}, merge=True)
+        if contributions:
+            batch.set(ref, dict(meta, days={day: contributions}), merge=True)
+
+
+def rebuild_rollups(start=None, end=None):
+    """Re-derive the rollup buckets for every day in [start, end] from attendance.
+
+    Returns the number of days written.
+    """
+    days = {day: rollup_contributions(AttendanceDay.from_dict(day, data))
+            for day, data in iter_attendance_days(start, end)}
+    if not days:
+        return 0
+    first = date.fromisoformat(start or min(days))
+    last = date.fromisoformat(end or max(days))
+    calendar = [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+    _write_rollup_days(calendar, days)
+    return len(days)
+
+
+def _write_rollup_days(calendar, contributions):
+    # Each day is at most 6 writes; stay under Firestore's 500 per batch
+    for chunk in _chunked(calendar, 80):
+        batch = db.batch()
+        for day in chunk:
+            add_rollup_day(batch, day, contributions.get(day))
+        batch.commit()
+
+
+def _rollup_state_ref():
+    return db.collection('attendance_rollups').document('_state')
+
+
+def _read_rollup_days(days):
+    """{day: contributions} read from attendance for the given days (missing days are absent)"""
+    refs = [db.collection('attendance').document(day) for day in days]
+    return {
+        snap.id: rollup_contributions(AttendanceDay.from_dict(snap.id, read_day_data(snap.id, snap.to_dict() or {})))
+        for snap in (db.get_all(refs) if refs else []) if snap.exists
+    }
+
+
+def update_rollups():
+    """Roll up the days that ended since the last run and past days stamped as changed.
+
+    The first run rebuilds every day before today. Returns the number of days rewritten.
+    """
+    started = time.time()
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    snap = _rollup_state_ref().get()
+    state = (snap.to_dict() or {}) if snap.exists else {}
+    through, cursor = state.get("through"), state.get("cursor")
+    if through is None or cursor is None:
+        count = rebuild_rollups(end=yesterday)
+        _rollup_state_ref().set({"through": yesterday, "cursor": started})
+        return count
+
+    days = set()
+    day = date.fromisoformat(through) + timedelta(days=1)
+    while day.isoformat() <= yesterday:
+        days.add(day.isoformat())
+        day += timedelta(days=1)
+    new_cursor = cursor
+    for changed, stamp in iter_day_changes(cursor):
+        new_cursor = max(new_cursor, stamp)
+        if changed <= yesterday:
+            days.add(changed)
+
+    days = sorted(days)
+    _write_rollup_days(days, _read_rollup_days(days))
+    _rollup_state_ref().set({"through": max(through, yesterday), "cursor": new_cursor})
+    return len(days)
+
+
+def rollup_loop():
+    """Background thread that keeps the rollups up to date"""
+    while True:
+        if db is not None:
+            try:
+                count = update_rollups()
+                if count:
+                    print(f"Rolled up {count} attendance days")
+            except Exception as e:
+                print(f"Rollup error: {e}")
+        time.sleep(ROLLUP_INTERVAL_SECONDS)
+
+
+def plan_rollup_reads(start, end):
+    """Cover [start, end] with the fewest buckets, largest first.
+
+    Returns [(bucket id, first day, last day)] in date order; weeks are cut at
+    month and season boundaries so the next bucket can be a whole month.
+    """
+    plan = []
+    cursor, last = date.fromisoformat(start), date.fromisoformat(end)
+    while cursor <= last:
+        for kind in ("season", "month"):
+            bucket_id, bucket_start, bucket_end = rollup_bucket(kind, cursor)
+            if bucket_start == cursor and bucket_end <= last:
+                break
+        else:
+            bucket_id, _, bucket_end = rollup_bucket("week", cursor)
+            bucket_end = min(bucket_end, last, rollup_bucket("month", cursor)[2], rollup_bucket("season", cursor)[2])
+        plan.append((bucket_id, cursor.isoformat(), bucket_end.isoformat()))
+        cursor = bucket_end + timedelta(days=1)
+    return plan
+
+
+def period_key(day, group):
+    if group == "day":
+        return day
+    _, start, _ = rollup_bucket(group, date.fromisoformat(day))
+    return start.isoformat()
+
+
+def query_rollups(start, end, group="week"):
+    """Per-member totals, daily headcounts and a per-period series for [start, end]"""
+    plan = plan_rollup_reads(start, end)
+    refs = {bucket_id: db.collection('attendance_rollups').document(bucket_id) for bucket_id, _, _ in plan}
+    refs["_state"] = _rollup_state_ref()
+    buckets = {snap.id: snap.to_dict() or {} for snap in db.get_all(list(refs.values())) if snap.exists}
+
+    # Days the rollup job hasn't reached (normally just today) come straight from attendance
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    through = min(buckets.pop("_state", {}).get("through") or yesterday, end)
+    live = []
+    day = max(date.fromisoformat(through) + timedelta(days=1), date.fromisoformat(start))
+    while day <= min(date.fromisoformat(end), date.today()):
+        live.append(day.isoformat())
+        day += timedelta(days=1)
+
+    daily = {}
+    for bucket_id, first, last in plan:
+        for day, contributions in (buckets.get(bucket_id) or {}).get("days", {}).items():
+            if first <= day <= min(last, through):
+                daily[day] = contributions
+    daily.update(_read_rollup_days(live))
+
+    members = {}
+    headcount = {}
+    series = {}
+    for day, contributions in sorted(daily.items()):
+        if not contributions:
+            continue
+        headcount[day] = len(contributions)
+        period = series.setdefault(period_key(day, group), {"hours": 0.0, "attendance": 0, "members": set()})
+        for uid, hours in contributions.items():
+            totals = members.setdefault(uid, {"hours": 0.0, "days": 0})
+            totals["hours"] += hours
+            totals["days"] += 1
+            period["hours"] += hours
+            period["attendance"] += 1
+            period["members"].add(uid)
+
+    names = get_all_card_names()
+    return {
+        "start": start,
+        "end": end,
+        "reads": len(refs) + len(live),
+        "members": sorted(
+            ({"uid": uid, "name": names.get(uid), "hours": round(t["hours"], 2), "days": t["days"]}
+             for uid, t in members.items()),
+            key=lambda m: -m["hours"]
+        ),
+        "headcount": headcount,
+        "series": [
+            {"period": key, "hours": round(p["hours"], 2), "attendance": p["attendance"], "members": len(p["members"])}
+            for key, p in sorted(series.items())
+        ]
+    }
+
+
+# ---------------------------------------------------------------------------
+# Hours recompute
+# ---------------------------------------------------------------------------
+
+def recompute_hours(start=None, end=None, policy=None, dry_run=False):
+    """Re-derive every entry's hours in [start, end] under `policy`, writing back only what changed.
+
+    All sessions in the range are flattened into one pair of columns and
+    credited in a single pass; open sessions on past days are closed at the
+    auto-close time through the event log, like auto sign-out. Manual entries
+    without sign-in times are left alone.
+    """
+    policy = policy or hours_policy
+    today = date.today().isoformat()
+    entries = []  # (day, entry, stored dict)
+    sessions = []
+    days = 0
+    for day, data in iter_attendance_days(start, end):
+        days += 1
+        for entry in AttendanceDay.from_dict(day, data).entries.values():
+            if not entry.sessions:
+                continue
+            stored = entry.to_dict()
+            if entry.signed_in and day < today:
+                close_at = policy.auto_close_at(entry.sessions[-1][0])
+                if not dry_run:
+                    append_tap_event(entry.uid, "sign_out", close_at, source="auto", day=day)
+                # Mirror the logged event so the write below keeps its id
+                entry.apply_event(make_tap_event(entry.uid, "sign_out", close_at, source="auto", day=day))
+            entries.append((day, entry, stored))
+            sessions.extend(s for s in entry.sessions if s[1] is not None)
+
+    for session, hours in zip(sessions, policy.session_hours([s[0] for s in sessions], [s[1] for s in sessions])):
+        session[2] = hours
+    changed = []
+    for day, entry, stored in entries:
+        policy.cap_day(entry.sessions)
+        if entry.to_dict() != stored:
+            changed.append((day, entry))
+
+    if changed and not dry_run:
+        # Each entry is at most 2 writes (entry and its day's change stamp)
+        for chunk in _chunked(changed, 100):
+            batch = db.batch()
+            for day, entry in chunk:
+                queue_entry_write(batch, day, entry)
+            for day in {day for day, _ in chunk}:
+                queue_day_changed(batch, day)
+            batch.commit()
+        invalidate_attendance_reads()
+        season_summary.invalidate()
+    return {"days": days, "entries": len(entries), "sessions": len(sessions), "changed": len(changed)}
+
+
+# ---------------------------------------------------------------------------
+# Member search
+#
+# An in-memory index over card_names so lookups don't ship the whole roster to
+# the client: a sorted (token, uid) list answers prefix queries with a bisect,
+# and a trigram index over each word of each name catches typos. Every query
+# word is scored against its best-matching name word, so one misspelled word
+# isn't drowned out by the rest of a long name.
+# ---------------------------------------------------------------------------
+
+def normalize_search_text(text):
+    """Lowercase and strip accents so "José" matches "jose" """
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower().strip()
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b):
+    """Levenshtein distance, counting a swap of adjacent letters as one edit"""
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def word_similarity(query_word, name_word):
+    """0..1 similarity of two words: trigram overlap (Dice), or edit distance for short typos"""
+    if len(query_word) > 1 and name_word.startswith(query_word):
+        # A partly typed word, e.g. "alex" in "alex hamiltn"
+        return 0.9
+    a, b = trigrams(query_word), trigrams(name_word)
+    dice = 2 * len(a & b) / (len(a) + len(b))
+    edits = 1 - edit_distance(query_word, name_word) / max(len(query_word), len(name_word))
+    return max(dice, edits)
+
+
+class MemberSearchIndex:
+    """Prefix and fuzzy name search over the card name roster"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.names = {}  # uid -> display name
+        self.normalized = {}  # uid -> normalized name
+        self.tokens = []  # sorted (token, uid), one per word of each name plus the uid itself
+        self.grams = collections.defaultdict(set)  # trigram -> (uid, name word)
+        self.source = None  # roster dict the index was built from
+
+    def _tokens_for(self, uid, name):
+        return [(token, uid) for token in set(name.split())] + [(uid.lower(), uid)]
+
+    def _add(self, uid, name):
+        normalized = normalize_search_text(name)
+        self.names[uid] = name
+        self.normalized[uid] = normalized
+        for token in self._tokens_for(uid, normalized):
+            bisect.insort(self.tokens, token)
+        for word in set(normalized.split()):
+            for gram in trigrams(word):
+                self.grams[gram].add((uid, word))
+
+    def _remove(self, uid):
+        normalized = self.normalized.pop(uid, None)
+        if normalized is None:
+            return
+        del self.names[uid]
+        for token in self._tokens_for(uid, normalized):
+            i = bisect.bisect_left(self.tokens, token)
+            if i < len(self.tokens) and self.tokens[i] == token:
+                del self.tokens[i]
+        for word in set(normalized.split()):
+            for gram in trigrams(word):
+                self.grams[gram].discard((uid, word))
+
+    def ensure_current(self):
+        """Rebuild from the (cached) roster if it changed outside set_card_name"""
+        roster = get_all_card_names()
+        with self.lock:
+            if roster is self.source:
+                return
+            if roster != self.names:
+                self.names, self.normalized, self.tokens = {}, {}, []
+                self.grams = collections.defaultdict(set)
+                for uid, name in roster.items():
+                    if name:
+                        self._add(uid, name)
+            self.source = roster
+
+    def update(self, uid, name):
+        """Keep the index current after a name is saved"""
+        with self.lock:
+            self._remove(uid)
+            if name:
+                self._add(uid, name)
+
+    def search(self, query, limit=10):
+        q = normalize_search_text(query)
+        if not q:
+            return []
+        scores = {}
+        with self.lock:
+            # Prefix matches on any word of the name (or on the uid)
+            i = bisect.bisect_left(self.tokens, (q,))
+            while i < len(self.tokens) and self.tokens[i][0].startswith(q):
+                uid = self.tokens[i][1]
+                normalized = self.normalized.get(uid, "")
+                if normalized == q:
+                    score = 1.0
+                elif normalized.startswith(q):
+                    score = 0.9
+                else:
+                    score = 0.75
+                scores[uid] = max(scores.get(uid, 0), score)
+                i += 1
+
+            # Fuzzy matches: each query word against the most similar word of each
+            # name sharing a trigram with it, averaged over the query words
+            query_words = q.split()
+            best = collections.defaultdict(lambda: [0.0] * len(query_words))  # uid -> per-word best
+            for n, query_word in enumerate(query_words):
+                candidates = set()
+                for gram in trigrams(query_word):
+                    candidates |= self.grams.get(gram, set())
+                for uid, word in candidates:
+                    best[uid][n] = max(best[uid][n], word_similarity(query_word, word))
+            for uid, per_word in best.items():
+                similarity = sum(per_word) / len(per_word)
+                if similarity >= 0.5:
+                    scores[uid] = max(scores.get(uid, 0), round(0.7 * similarity, 3))
+
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], self.names.get(item[0], "")))
+            return [{"uid": uid, "name": self.names.get(uid), "score": score} for uid, score in ranked[:limit]]
+
+
+member_search_index = MemberSearchIndex()
+
+# ---------------------------------------------------------------------------
+# Reader transport
+#
+# All APDU traffic goes through a ReaderSession so every command gets a
+# deadline, bounded retries and latency accounting. The backend is chosen with
+# `NFC_TRANSPORT`:
+#   pcsc (default)   talk to the first PC/SC reader
+#   record:<path>    talk to the reader and append every exchange to <path>
+#   replay:<path>    replay a recording without any hardware attached
+# ---------------------------------------------------------------------------
+
+class ReaderTimeout(Exception):
+    """Raised when a reader command misses its deadline"""
+
+
+class ReaderCommand:
+    """A named APDU with its own deadline"""
+    __slots__ = ("name", "apdu", "timeout")
+
+    def __init__(self, name, apdu, timeout=None):
+        self.name = name
+        self.apdu = list(apdu)
+        self.timeout = timeout
+
+
+def cmd_get_uid():
+    return ReaderCommand("get_uid", [0xFF, 0xCA, 0x00, 0x00, 0x00])
+
+
+def cmd_firmware_version():
+    return ReaderCommand("firmware_version", [0xFF, 0x00, 0x48, 0x00, 0x00])
+
+
+def cmd_set_buzzer(enabled):
+    return ReaderCommand("set_buzzer", [0xFF, 0x00, 0x52, 0xFF if enabled else 0x00, 0x00])
+
+
+def cmd_load_key(key_bytes):
+    return ReaderCommand("load_key", [0xFF, 0x82, 0x00, 0x00, 0x06] + list(key_bytes))
+
+
+def cmd_authenticate(block, key_type):
+    key_code = 0x60 if key_type == "A" else 0x61
+    return ReaderCommand("authenticate", [0xFF, 0x86, 0x00, 0x00, 0x05, 0x01, 0x00, block, key_code, 0x00])
+
+
+def cmd_read_binary(block, length):
+    # Le of 0x00 requests 256 bytes (a full 16-block sector)
+    return ReaderCommand("read_binary", [0xFF, 0xB0, 0x00, block, length & 0xFF], timeout=2.0)
+
+
+class ReaderStats:
+    """Per-command latency accounting shared by all sessions"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._commands = {}
+
+    def record(self, name, elapsed, outcome):
+        with self._lock:
+            s = self._commands.setdefault(name, {
+                "count": 0, "errors": 0, "timeouts": 0, "retries": 0, "noCard": 0, "totalMs": 0.0, "maxMs": 0.0
+            })
+            if outcome == "retry":
+                s["retries"] += 1
+                return
+            s["count"] += 1
+            if outcome == "timeout":
+                s["timeouts"] += 1
+            elif outcome == "error":
+                s["errors"] += 1
+            elif outcome == "no_card":
+                s["noCard"] += 1
+            ms = elapsed * 1000
+            s["totalMs"] += ms
+            s["maxMs"] = max(s["maxMs"], ms)
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for name, s in self._commands.items():
+                entry = dict(s)
+                entry["avgMs"] = round(s["totalMs"] / s["count"], 3) if s["count"] else 0
+                entry["totalMs"] = round(s["totalMs"], 3)
+                entry["maxMs"] = round(s["maxMs"], 3)
+                result[name] = entry
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._commands.clear()
+
+
+reader_stats = ReaderStats()
+
+
+class ReaderWorker:
+    """One long-lived daemon thread that runs a reader's PC/SC calls.
+
+    PC/SC calls have no timeout of their own, so callers wait on the result
+    with a deadline. Once a call misses it the thread may be stuck inside PC/SC
+    indefinitely, so the worker refuses further work until the reader is
+    re-initialized with a fresh worker. As a daemon, a stuck thread never
+    blocks process exit.
+    """
+
+    def __init__(self):
+        self.tasks = queue.Queue()
+        self.stuck = False
+        self.thread = threading.Thread(target=self._run, name="reader-io", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            fn, future = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+
+    def call(self, fn, timeout):
+        """Run `fn` on the worker; raises concurrent.futures.TimeoutError after `timeout`"""
+        if self.stuck:
+            raise ReaderTimeout("Reader is unresponsive until it is re-initialized")
+        future = concurrent.futures.Future()
+        self.tasks.put((fn, future))
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            self.stuck = True
+            future.cancel()
+            raise
+
+    def stop(self):
+        """Let the thread exit once it finishes (or abandons) its current call"""
+        self.tasks.put(None)
+
+
+# Worker for the current reader; replaced whenever the reader is (re)initialized
+reader_worker = None
+
+
+def get_reader_worker():
+    global reader_worker
+    if reader_worker is None:
+        reader_worker = ReaderWorker()
+    return reader_worker
+
+
+class ReaderSession:
+    """A single connection to the reader with deadlines, retries and latency stats.
+
+    Calls run on the reader's ReaderWorker and the caller waits at most the
+    command's deadline. A session whose call timed out is considered broken and
+    refuses further use; callers open a new one. "No card" on connect is an
+    answer rather than a fault: it is raised at once, without retries.
+    """
+
+    def __init__(self, connection, timeout=1.0, retries=2, backoff=0.05, stats=reader_stats, worker=None):
+        self.connection = connection
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.stats = stats
+        self.worker = worker or get_reader_worker()
+        self.broken = False
+
+    def _call(self, name, fn, timeout):
+        if self.broken:
+            raise ReaderTimeout("Reader session is no longer usable after a timeout")
+        started = time.perf_counter()
+        try:
+            result = self.worker.call(fn, timeout)
+        except concurrent.futures.TimeoutError:
+            self.broken = True
+            self.stats.record(name, time.perf_counter() - started, "timeout")
+            raise ReaderTimeout(f"{name} timed out after {timeout}s")
+        except ReaderTimeout:
+            self.broken = True
+            raise
+        except NoCardException:
+            self.stats.record(name, time.perf_counter() - started, "no_card")
+            raise
+        except Exception:
+            self.stats.record(name, time.perf_counter() - started, "error")
+            raise
+        self.stats.record(name, time.perf_counter() - started, "ok")
+        return result
+
+    def _with_retries(self, name, fn, timeout):
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                return self._call(name, fn, timeout)
+            except (ReaderTimeout, NoCardException):
+                # A stuck worker won't recover by retrying, and no card is a valid answer
+                raise
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                self.stats.record(name, 0, "retry")
+                time.sleep(delay)
+                delay *= 2
+
+    def connect(self):
+        return self._with_retries("connect", self.connection.connect, self.timeout)
+
+    def get_atr(self):
+        return self._call("get_atr", self.connection.getATR, self.timeout)
+
+    def transmit(self, command):
+        """Send a ReaderCommand and return (data, sw1, sw2).
+
+        Transport errors are retried; a status word other than 90 00 is an
+        answer from the card and is returned as-is.
+        """
+        timeout = command.timeout or self.timeout
+        return self._with_retries(command.name, lambda: self.connection.transmit(command.apdu), timeout)
+
+    def ok(self, command):
+        """Send a command and return its data if the card answered 90 00, else None"""
+        data, sw1, sw2 = self.transmit(command)
+        return data if (sw1, sw2) == (0x90, 0x00) else None
+
+    def close(self):
+        if not self.broken:
+            try:
+                self.connection.disconnect()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RecordingConnection:
+    """Wraps a real connection and appends every exchange to a JSON-lines file"""
+
+    def __init__(self, connection, path):
+        self.connection = connection
+        self.path = path
+
+    def _record(self, entry):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            self.connection.connect()
+            self._record({"op": "connect", "ok": True, "ms": (time.perf_counter() - started) * 1000})
+        except Exception as e:
+            self._record({"op": "connect", "ok": False, "error": str(e), "noCard": isinstance(e, NoCardException),
+                          "ms": (time.perf_counter() - started) * 1000})
+            raise
+
+    def disconnect(self):
+        self.connection.disconnect()
+
+    def getATR(self):
+        atr = self.connection.getATR()
+        self._record({"op": "atr", "atr": list(atr)})
+        return atr
+
+    def transmit(self, apdu):
+        started = time.perf_counter()
+        data, sw1, sw2 = self.connection.transmit(apdu)
+        self._record({
+            "op": "transmit", "apdu": toHexString(apdu), "data": list(data),
+            "sw1": sw1, "sw2": sw2, "ms": (time.perf_counter() - started) * 1000
+        })
+        return data, sw1, sw2
+
+
+class ReplayConnection:
+    """Serves responses from a recording, keyed by APDU.
+
+    Each APDU replays its recorded responses in order and then keeps repeating
+    the last one, so polling loops can run indefinitely against a short
+    recording. With `replay_latency` the recorded timings are slept as well.
+    """
+
+    def __init__(self, recording, replay_latency=False):
+        self.recording = recording
+        self.replay_latency = replay_latency
+
+    def _delay(self, entry):
+        if self.replay_latency:
+            time.sleep(entry.get("ms", 0) / 1000.0)
+
+    def connect(self):
+        entry = self.recording.next("connect")
+        if entry is None:
+            return
+        self._delay(entry)
+        if not entry.get("ok", True):
+            # Recordings made before "noCard" was recorded only ever failed for lack of a card
+            if entry.get("noCard", True):
+                raise NoCardException(entry.get("error", "Card not present"))
+            raise Exception(entry.get("error"))
+
+    def disconnect(self):
+        pass
+
+    def getATR(self):
+        entry = self.recording.next("atr")
+        if entry is None:
+            raise Exception("No ATR in recording")
+        return entry["atr"]
+
+    def transmit(self, apdu):
+        entry = self.recording.next(toHexString(list(apdu)))
+        if entry is None:
+            # Unknown command: answer like a reader that doesn't support it
+            return [], 0x6A, 0x81
+        self._delay(entry)
+        return entry["data"], entry["sw1"], entry["sw2"]
+
+
+class ReaderRecording:
+    """A recording loaded from disk, consumed per operation by ReplayConnection"""
+
+    def __init__(self, path):
+        self._queues = {}
+        self._lock = threading.Lock()
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                key = entry["apdu"] if entry["op"] == "transmit" else entry["op"]
+                self._queues.setdefault(key, []).append(entry)
+        self._positions = {key: 0 for key in self._queues}
+
+    def next(self, key):
+        with self._lock:
+            entries = self._queues.get(key)
+            if not entries:
+                return None
+            pos = self._positions[key]
+            self._positions[key] = min(pos + 1, len(entries) - 1)
+            return entries[pos]
+
+
+class ReplayReader:
+    """Stands in for a PC/SC reader when replaying a recording"""
+
+    def __init__(self, path, replay_latency=False):
+        self.path = path
+        self.recording = ReaderRecording(path)
+        self.replay_latency = replay_latency
+
+    def createConnection(self):
+        return ReplayConnection(self.recording, self.replay_latency)
+
+    def __str__(self):
+        return f"Replay ({os.path.basename(self.path)})"
+
+
+nfc_transport = os.environ.get('NFC_TRANSPORT', 'pcsc')
+_replay_reader = None
+
+
+def list_readers():
+    """List available readers for the configured transport"""
+    global _replay_reader
+    if nfc_transport.startswith('replay:'):
+        if _replay_reader is None:
+            _replay_reader = ReplayReader(nfc_transport[len('replay:'):],
+                                          os.environ.get('NFC_REPLAY_LATENCY') == '1')
+        return [_replay_reader]
+    return readers()
+
+
+def open_reader_session(reader=None):
+    """Open a connected ReaderSession on the current reader, or return None if there is none"""
+    if reader is None:
+        # Discovery belongs to the reader supervisor; never do it on the request path
+        reader = nfc_reader
+        if reader is None:
             return None
+    connection = reader.createConnection()
+    if nfc_transport.startswith('record:'):
+        connection = RecordingConnection(connection, nfc_transport[len('record:'):])
+    session = ReaderSession(connection)
+    try:
+        session.connect()
+    except Exception:
+        session.close()
+        raise
+    return session
+
+
+def init_nfc_reader():
+    """Initialize NFC reader connection"""
+    global nfc_reader, nfc_connection, reader_worker
+    try:
+        r = list_readers()
+        if len(r) < 1:
+            return {"error": "No readers available!"}
         nfc_reader = r[0]
-    return nfc_reader.createConnection()
+        # A fresh worker; the old one may be stuck in a call that never returns
+        if reader_worker is not None:
+            reader_worker.stop()
+        reader_worker = ReaderWorker()
+        # No test connect here: it needs a card anyway, and an unbounded PC/SC
+        # call would stall the supervisor thread that calls this
+        nfc_connection = nfc_reader.createConnection()
+        return {"success": True, "reader": str(nfc_reader)}
+    except Exception as e:
+        return {"error": str(e)}
+
+# ---------------------------------------------------------------------------
+# Reader supervisor
+#
+# A single background thread owns PC/SC reader discovery. It notices unplug and
+# replug events, reconnects with exponential backoff and publishes reader
+# health; HTTP handlers and the detection loop only read that state.
+# ---------------------------------------------------------------------------
+
+READER_POLL_INTERVAL = float(os.environ.get('READER_POLL_INTERVAL', '1.0'))
+READER_BACKOFF_MIN = 0.25
+READER_BACKOFF_MAX = 8.0
+
+reader_available = threading.Event()
+reader_supervisor_thread = None
+_reader_health_lock = threading.Lock()
+reader_health = {
+    "connected": False,
+    "readerName": None,
+    "connectedSince": None,
+    "disconnects": 0,
+    "reconnects": 0,
+    "lastError": None,
+    "nextRetryIn": None,
+    "events": []
+}
+
+
+def _reader_event(kind, detail=None):
+    """Append a plug/unplug event to the health record (caller holds the lock)"""
+    reader_health["events"].append({"event": kind, "detail": detail, "timestamp": time.time()})
+    del reader_health["events"][:-20]
+    print(f"Reader {kind}" + (f": {detail}" if detail else ""))
+
+
+def get_reader_health():
+    """Snapshot of reader health for status endpoints"""
+    with _reader_health_lock:
+        health = dict(reader_health)
+        health["events"] = list(reader_health["events"])
+    since = health["connectedSince"]
+    health["uptimeSeconds"] = round(time.time() - since, 1) if health["connected"] and since else 0
+    return health
+
+
+def mark_reader_lost(error):
+    """Drop the current reader so the supervisor rediscovers it on its next pass"""
+    global nfc_reader
+    with _reader_health_lock:
+        if reader_health["connected"]:
+            reader_health["connected"] = False
+            reader_health["connectedSince"] = None
+            reader_health["disconnects"] += 1
+            _reader_event("unplugged", error)
+        reader_health["lastError"] = error
+    nfc_reader = None
+    reader_available.clear()
+
+
+def probe_reader(reader):
+    """True if the reader answers within the deadline; "no card" counts as an answer"""
+    try:
+        with open_reader_session(reader) as session:
+            session.get_atr()
+        return True
+    except NoCardException:
+        return True
+    except Exception:
+        return False
+
+
+def reader_supervisor_loop():
+    """Background thread that discovers the reader and reconnects after unplug events.
 
-def init_nfc_reader():
-    """Initialize NFC reader connection"""
-    global nfc_reader, nfc_connection
-    try:
-        r = readers()
-        if len(r) < 1:
-            return {"error": "No readers available!"}
-        nfc_reader = r[0]
-        nfc_connection = nfc_reader.createConnection()
-        # Test the connection by trying to connect (without requiring a card)
+    Reconnects back off exponentially whether the reader vanished, failed to
+    initialize or stopped answering; the backoff only resets once a probe of
+    an established connection succeeds, so a flapping reader can't spin.
+    """
+    backoff = READER_BACKOFF_MIN
+    ever_connected = False
+    connected = False
+
+    while True:
         try:
-            nfc_connection.connect()
-        except:
-            # Connection might fail if no card, but reader is still available
-            pass
-        return {"success": True, "reader": str(nfc_reader)}
-    except Exception as e:
-        return {"error": str(e)}
+            names = [str(r) for r in list_readers()]
+            error = None if names else "No readers available"
+        except Exception as e:
+            names, error = [], str(e)
+
+        if connected and nfc_reader is not None and str(nfc_reader) in names:
+            if probe_reader(nfc_reader):
+                # Healthy: nothing to do until the next poll
+                backoff = READER_BACKOFF_MIN
+                time.sleep(READER_POLL_INTERVAL)
+                continue
+            error = "Reader stopped responding"
+            mark_reader_lost(error)
+        elif nfc_reader is not None and str(nfc_reader) not in names:
+            mark_reader_lost("Reader disappeared")
+
+        if connected:
+            # Lost here or by a timed-out command elsewhere; wait before reconnecting
+            connected = False
+            with _reader_health_lock:
+                reader_health["nextRetryIn"] = backoff
+            time.sleep(backoff)
+            backoff = min(backoff * 2, READER_BACKOFF_MAX)
+            continue
+
+        if names:
+            result = init_nfc_reader()
+            error = result.get("error")
+            if error is None and not probe_reader(nfc_reader):
+                error = "Reader did not respond"
+                mark_reader_lost(error)
+            if error is None:
+                with _reader_health_lock:
+                    reader_health.update({
+                        "connected": True,
+                        "readerName": result["reader"],
+                        "connectedSince": time.time(),
+                        "lastError": None,
+                        "nextRetryIn": None
+                    })
+                    if ever_connected:
+                        reader_health["reconnects"] += 1
+                    _reader_event("reconnected" if ever_connected else "connected", result["reader"])
+                ever_connected = True
+                connected = True
+                reader_available.set()
+                continue
+
+        with _reader_health_lock:
+            reader_health["lastError"] = error
+            reader_health["nextRetryIn"] = backoff
+        time.sleep(backoff)
+        backoff = min(backoff * 2, READER_BACKOFF_MAX)
+
+
+def start_reader_supervisor():
+    """Start the reader supervisor thread if it isn't running yet"""
+    global reader_supervisor_thread
+    if reader_supervisor_thread is None or not reader_supervisor_thread.is_alive():
+        reader_supervisor_thread = threading.Thread(target=reader_supervisor_loop, name="reader_supervisor", daemon=True)
+        reader_supervisor_thread.start()
 
 def check_card_present():
     """Check if a card is present on the reader"""
-    global nfc_connection, nfc_reader
     try:
         if nfc_reader is None:
             return False
-        # Create a fresh connection each time to avoid hanging
-        connection = nfc_reader.createConnection()
-        connection.connect()
-        # Try to get UID - if it works, card is present
-        cmd = [0xFF, 0xCA, 0x00, 0x00, 0x00]
-        data, sw1, sw2 = connection.transmit(cmd)
-        return (sw1, sw2) == (0x90, 0x00)
+        # Open a fresh session each time to avoid hanging
+        with open_reader_session() as session:
+            # Try to get UID - if it works, card is present
+            return session.ok(cmd_get_uid()) is not None
+    except ReaderTimeout as e:
+        # A hung reader: let the supervisor reconnect it
+        mark_reader_lost(str(e))
+        return False
     except:
         return False
 
 def get_card_uid():
     """Get the UID of the card currently on the reader"""
-    global nfc_reader
     try:
         if nfc_reader is None:
             return None
-        # Create a fresh connection each time
-        connection = nfc_reader.createConnection()
-        connection.connect()
-        cmd = [0xFF, 0xCA, 0x00, 0x00, 0x00]
-        data, sw1, sw2 = connection.transmit(cmd)
-        if (sw1, sw2) == (0x90, 0x00):
-            return toHexString(data)
-        return None
+        with open_reader_session() as session:
+            data = session.ok(cmd_get_uid())
+            return toHexString(data) if data is not None else None
     except Exception as e:
         return None
 
 def get_card_info():
     """Get detailed information about the card"""
-    global nfc_reader
     try:
         if nfc_reader is None:
             return None
-        # Create a fresh connection each time
-        connection = nfc_reader.createConnection()
-        connection.connect()
-        atr = ATR(connection.getATR())
+        with open_reader_session() as session:
+            atr_bytes = session.get_atr()
+        atr = ATR(atr_bytes)
         hb = toHexString(atr.getHistoricalBytes())
         cardname = hb[-17:-12] if len(hb) >= 17 else "unknown"
         name = CARD_NAME_MAP.get(cardname, "Unknown")
@@ -406,11 +2615,452 @@ def get_card_info():
             "t0Supported": atr.isT0Supported(),
             "t1Supported": atr.isT1Supported(),
             "t15Supported": atr.isT15Supported(),
-            "atr": toHexString(connection.getATR())
+            "atr": toHexString(atr_bytes)
         }
     except Exception as e:
         return None
 
+# ---------------------------------------------------------------------------
+# Multi-kiosk sync
+#
+# With `CENTRAL_URL` set this server is an edge kiosk: its tap journal is
+# replayed to the central server over HTTP instead of to Firestore, one
+# gzip-compressed batch per request, and the central roster comes back in the
+# reply whenever it differs from the edge's copy. The central server is an
+# ordinary instance; `/api/sync/taps` applies each batch with apply_tap_batch.
+# ---------------------------------------------------------------------------
+
+CENTRAL_URL = os.environ.get('CENTRAL_URL', '').rstrip('/')
+KIOSK_ID = os.environ.get('KIOSK_ID') or socket.gethostname()
+# Shared secret edges send to the central server; the central server refuses syncs without it
+SYNC_TOKEN = os.environ.get('SYNC_TOKEN', '')
+SYNC_TIMEOUT_SECONDS = 10
+
+# Central side: kiosk id -> {"lastSyncAt", "taps", "applied"}
+kiosk_sync_stats = {}
+kiosk_sync_lock = threading.Lock()
+
+
+def roster_digest(names):
+    return hashlib.sha1(json.dumps(names, sort_keys=True).encode()).hexdigest()
+
+
+def sync_with_central(taps):
+    """Ship a batch of journaled taps to the central server and take its roster if it changed"""
+    body = gzip.compress(json.dumps({
+        "kiosk": KIOSK_ID,
+        "taps": taps,
+        "rosterDigest": tap_journal.roster_digest
+    }, separators=(",", ":")).encode())
+    headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+    if SYNC_TOKEN:
+        headers["X-Sync-Token"] = SYNC_TOKEN
+    response = requests.post(f"{CENTRAL_URL}/api/sync/taps", data=body, headers=headers, timeout=SYNC_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    reply = response.json()
+    if not reply.get("success"):
+        raise RuntimeError(reply.get("error") or "Central server rejected the batch")
+    if "roster" in reply:
+        tap_journal.set_roster(reply["roster"])
+    else:
+        tap_journal.roster_refreshed_at = time.time()
+    if "signedIn" in reply:
+        tap_journal.set_signed_in(reply["day"], reply["signedIn"])
+    return reply
+
+
+# ---------------------------------------------------------------------------
+# Tap journal
+#
+# Reader taps are appended to a local journal file, and fsynced, before they
+# are acknowledged. A replay worker drains the journal to Firestore in small
+# batches once it is reachable. Every journaled tap carries its event id, so a
+# tap replayed twice (e.g. after a crash before the checkpoint was written) is
+# applied once. Card names come from a local copy of the roster, so the kiosk
+# keeps accepting taps at reader speed while the network is down.
+#
+# A sign-out is refused only if the kiosk knows the member is not signed in:
+# its own unreplayed taps, on top of who was signed in today at the last
+# refresh (from Firestore, or from the central server's sync reply) plus the
+# taps replayed since. The snapshot is saved next to the roster so it survives
+# a restart. If it is missing or stale the sign-out is journaled anyway, and
+# replay, which ignores sign-outs without an open session, decides.
+#
+# `TAP_JOURNAL_PATH` sets the journal file; an empty string disables the
+# journal and taps are written straight to Firestore.
+# ---------------------------------------------------------------------------
+
+TAP_JOURNAL_BATCH = int(os.environ.get('TAP_JOURNAL_BATCH', '50'))
+# Rewrite the journal from scratch once it is fully replayed and this large
+TAP_JOURNAL_COMPACT_BYTES = 1024 * 1024
+ROSTER_REFRESH_SECONDS = int(os.environ.get('ROSTER_REFRESH_SECONDS', '300'))
+# A signed-in snapshot older than this no longer rules out a sign-out
+SIGNED_IN_STALE_SECONDS = 2 * ROSTER_REFRESH_SECONDS
+
+
+class TapJournal:
+    """Crash-safe append-only journal of reader taps awaiting replay"""
+
+    def __init__(self, path, batch_size=TAP_JOURNAL_BATCH):
+        self.path = path
+        self.offset_path = path + ".offset"
+        self.roster_path = path + ".roster.json"
+        self.signed_in_path = path + ".signed_in.json"
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pending = collections.deque()  # (end offset in the file, record)
+        self.offset = 0  # bytes of the journal already replayed
+        self.size = 0
+        self.roster = {}
+        self.roster_digest = None
+        self.roster_refreshed_at = 0
+        self.open_day = None  # day the signed-in snapshot describes
+        self.open_uids = set()  # members signed in on open_day
+        self.open_refreshed_at = 0  # when the snapshot was last read from the source of truth
+        self.replayed = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_replay_at = None
+        self._file = None
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def open(self):
+        """Load the roster and any taps a previous run did not replay"""
+        with self.lock:
+            if self._file is not None:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            if os.path.exists(self.roster_path):
+                with open(self.roster_path) as f:
+                    self.roster = json.load(f)
+                self.roster_digest = roster_digest(self.roster)
+            if self.open_day is None and os.path.exists(self.signed_in_path):
+                with open(self.signed_in_path) as f:
+                    snapshot = json.load(f)
+                self.open_day = snapshot["day"]
+                self.open_uids = set(snapshot["uids"])
+                self.open_refreshed_at = snapshot["refreshedAt"]
+            if os.path.exists(self.offset_path):
+                with open(self.offset_path) as f:
+                    self.offset = int(f.read() or 0)
+
+            with open(self.path, 'a+b') as f:
+                f.seek(0)
+                data = f.read()
+            if self.offset > len(data):
+                # The journal was compacted after the checkpoint was written
+                self.offset = 0
+            pos = self.offset
+            while True:
+                newline = data.find(b"\n", pos)
+                if newline < 0:
+                    break
+                self.pending.append((newline + 1, json.loads(data[pos:newline])))
+                pos = newline + 1
+
+            self._file = open(self.path, 'ab')
+            if pos < len(data):
+                # A torn final line was never acknowledged; drop it
+                self._file.truncate(pos)
+            self.size = pos
+        if self.pending:
+            print(f"Tap journal: {len(self.pending)} taps waiting to be replayed")
+            self.wakeup.set()
+
+    def append(self, uid, event_type, source="reader", ts=None, event_id=None):
+        """Durably record a tap; returns once it is safe to acknowledge"""
+        if self._file is None:
+            self.open()
+        ts = time.time() if ts is None else ts
+        record = {
+            "event_id": event_id or make_event_id(uid, event_type, ts),
+            "uid": uid,
+            "type": event_type,
+            "ts": ts,
+            "source": source
+        }
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+        with self.lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.size += len(line)
+            self.pending.append((self.size, record))
+        self.wakeup.set()
+        return record
+
+    def replay_batch(self):
+        """Apply up to `batch_size` pending taps in order; returns how many were applied"""
+        with self.lock:
+            batch = [self.pending[i] for i in range(min(self.batch_size, len(self.pending)))]
+        if not batch:
+            return 0
+        # Both paths skip taps already applied, so a batch can be resent whole after a failure
+        if CENTRAL_URL:
+            sync_with_central([record for _, record in batch])
+        else:
+            apply_tap_batch([record for _, record in batch])
+        self._checkpoint(len(batch), batch[-1][0])
+        return len(batch)
+
+    def signed_in(self, uid, day=None):
+        """Whether `uid` is signed in on `day` (default today) as far as this kiosk knows.
+
+        Returns None if it doesn't know: no snapshot of that day, or a stale one.
+        """
+        day = day or date.today().isoformat()
+        with self.lock:
+            for _, record in reversed(self.pending):
+                if record["uid"] == uid and date.fromtimestamp(record["ts"]).isoformat() == day:
+                    return record["type"] == "sign_in"
+            if uid in self.open_uids and self.open_day == day:
+                return True
+            if self.open_day != day or time.time() - self.open_refreshed_at > SIGNED_IN_STALE_SECONDS:
+                return None
+            return False
+
+    def set_signed_in(self, day, uids):
+        with self.lock:
+            self.open_day = day
+            self.open_uids = set(uids)
+            self.open_refreshed_at = time.time()
+            self._save_signed_in()
+
+    def note(self, day, uid, signed_in):
+        """Keep the signed-in snapshot current after a write to `day`"""
+        with self.lock:
+            self._note(day, uid, signed_in)
+            self._save_signed_in()
+
+    def _save_signed_in(self):
+        if self._file is None:
+            # Not this process's journal (e.g. a script writing taps)
+            return
+        tmp = self.signed_in_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump({"day": self.open_day, "uids": sorted(self.open_uids), "refreshedAt": self.open_refreshed_at}, f)
+        os.replace(tmp, self.signed_in_path)
+
+    def _note(self, day, uid, signed_in):
+        if day != self.open_day:
+            if day != date.today().isoformat():
+                return
+            # First write of a new day, or no snapshot yet: start from nobody signed in
+            self.open_day, self.open_uids = day, set()
+        if signed_in:
+            self.open_uids.add(uid)
+        else:
+            self.open_uids.discard(uid)
+
+    def _checkpoint(self, count, offset):
+        with self.lock:
+            for _ in range(count):
+                record = self.pending.popleft()[1]
+                self._note(date.fromtimestamp(record["ts"]).isoformat(), record["uid"], record["type"] == "sign_in")
+            self._save_signed_in()
+            self.replayed += count
+            self.last_replay_at = time.time()
+            self.offset = offset
+            if not self.pending and self.size >= TAP_JOURNAL_COMPACT_BYTES:
+                self._file.truncate(0)
+                self.offset = self.size = 0
+            tmp = self.offset_path + ".tmp"
+            with open(tmp, 'w') as f:
+                f.write(str(self.offset))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.offset_path)
+
+    def known_name(self, uid):
+        return self.roster.get(uid)
+
+    def remember_name(self, uid, name):
+        self.roster[uid] = name
+
+    def refresh_roster(self):
+        """Keep a local copy of card names, and of who is signed in, for taps while offline"""
+        if CENTRAL_URL:
+            # An empty sync returns the central roster if ours is out of date
+            sync_with_central([])
+            return
+        names = get_all_card_names()
+        if names:
+            self.set_roster(names)
+        if db is None:
+            return
+        today = date.today().isoformat()
+        # Read directly: a failed read must leave the last snapshot in place
+        attendance_day = load_attendance_day(today)
+        self.set_signed_in(today, [uid for uid, entry in attendance_day.entries.items() if entry.signed_in])
+
+    def set_roster(self, names):
+        self.roster = dict(names)
+        self.roster_digest = roster_digest(self.roster)
+        self.roster_refreshed_at = time.time()
+        tmp = self.roster_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.roster, f)
+        os.replace(tmp, self.roster_path)
+
+    def stats(self):
+        with self.lock:
+            oldest = self.pending[0][1]["ts"] if self.pending else None
+            return {
+                "enabled": self.enabled,
+                "centralUrl": CENTRAL_URL or None,
+                "pending": len(self.pending),
+                "lagSeconds": round(time.time() - oldest, 1) if oldest else 0,
+                "replayed": self.replayed,
+                "failures": self.failures,
+                "lastError": self.last_error,
+                "lastReplayAt": self.last_replay_at
+            }
+
+
+tap_journal = TapJournal(os.environ.get(
+    'TAP_JOURNAL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'tap_journal.jsonl')
+))
+
+
+def tap_journal_replay_loop():
+    """Background thread that drains the tap journal to Firestore"""
+    tap_journal.open()
+    # Replay anything left over and take the first roster snapshot right away
+    tap_journal.wakeup.set()
+    backoff = 1
+    while True:
+        tap_journal.wakeup.wait(timeout=ROSTER_REFRESH_SECONDS)
+        tap_journal.wakeup.clear()
+        try:
+            while tap_journal.replay_batch():
+                pass
+            tap_journal.last_error = None
+            backoff = 1
+            if time.time() - tap_journal.roster_refreshed_at >= ROSTER_REFRESH_SECONDS:
+                tap_journal.refresh_roster()
+        except Exception as e:
+            tap_journal.failures += 1
+            tap_journal.last_error = str(e)
+            print(f"Tap journal replay failed, retrying in {backoff}s: {e}")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+            tap_journal.wakeup.set()
+
+
+def start_tap_journal():
+    """Start the journal's replay worker if the journal is enabled"""
+    if tap_journal.enabled:
+        threading.Thread(target=tap_journal_replay_loop, name="tap_journal_replay", daemon=True).start()
+    elif CENTRAL_URL:
+        print("Warning: CENTRAL_URL is set but TAP_JOURNAL_PATH is empty; taps will not be synced")
+
+
+def lookup_card_name(uid):
+    """Name for a tapped card, from the local roster when it knows the card"""
+    if tap_journal.enabled:
+        name = tap_journal.known_name(uid)
+        if name:
+            return name
+    return get_card_name(uid)
+
+
+class TapDebouncer:
+    """Suppress repeat taps of the same card within a per-uid cooldown window.
+
+    A card left on the reader, or tapped twice in quick succession, would
+    otherwise trigger another read/rewrite of the day document. Inside the
+    window the previous outcome is replayed from memory instead.
+    """
+
+    def __init__(self, cooldown_seconds):
+        self.cooldown_seconds = cooldown_seconds
+        self.suppressed_writes = 0
+        self._last_taps = {}  # uid -> (timestamp, action, result)
+        self._lock = threading.Lock()
+
+    def check(self, uid, action, now=None):
+        """Return the remembered result if this tap is a repeat, else None"""
+        now = time.time() if now is None else now
+        with self._lock:
+            last = self._last_taps.get(uid)
+            if last is None:
+                return None
+            last_time, last_action, last_result = last
+            if last_action != action or now - last_time >= self.cooldown_seconds:
+                return None
+            self.suppressed_writes += 1
+            return last_result
+
+    def remember(self, uid, action, result, now=None):
+        """Remember the outcome of a tap that reached storage"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._last_taps[uid] = (now, action, result)
+            # Drop expired entries so the map doesn't grow with every card ever seen
+            expired = [u for u, (t, _, _) in self._last_taps.items() if now - t >= self.cooldown_seconds]
+            for u in expired:
+                del self._last_taps[u]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cooldownSeconds": self.cooldown_seconds,
+                "suppressedWrites": self.suppressed_writes,
+                "trackedCards": len(self._last_taps)
+            }
+
+
+# Cooldown for repeat taps of the same card, configurable via `TAP_COOLDOWN_SECONDS`
+tap_debouncer = TapDebouncer(float(os.environ.get('TAP_COOLDOWN_SECONDS', '10')))
+
+
+def is_signed_in_for_sign_out(uid):
+    """Whether a journaled sign-out for `uid` should be accepted.
+
+    Asks the journal first. Unknown counts as signed in. A member it knows
+    isn't signed in is checked against Firestore while replay is succeeding,
+    since the snapshot misses other writers (e.g. the attendance pages) until
+    the next refresh.
+    """
+    known = tap_journal.signed_in(uid)
+    if known is not False:
+        return True
+    if CENTRAL_URL or db is None or tap_journal.last_error is not None:
+        return False
+    try:
+        entry = load_attendance_entry(date.today().isoformat(), uid)
+    except Exception as e:
+        print(f"Could not check sign-in state for {uid}: {e}")
+        return True
+    return entry is not None and entry.signed_in
+
+
+def record_tap(uid, sign_in):
+    """Record a sign-in or sign-out tap, suppressing repeats inside the cooldown"""
+    action = "sign_in" if sign_in else "sign_out"
+    result = tap_debouncer.check(uid, action)
+    if result is not None:
+        return result, True
+    if tap_journal.enabled:
+        if not sign_in and not is_signed_in_for_sign_out(uid):
+            # Known not to be signed in; don't confirm a sign-out that changes nothing
+            result = False
+        else:
+            # Acknowledged once journaled; the replay worker writes it to Firestore
+            tap_journal.append(uid, action)
+            result = True
+    else:
+        result = record_sign_in(uid) if sign_in else record_sign_out(uid)
+    # A failed sign-in is a storage error rather than an answer, so let the next tap retry it
+    if result or not sign_in:
+        tap_debouncer.remember(uid, action, result)
+    return result, False
+
+
 def read_card_with_retry(max_attempts=3, delay=0.1):
     """Attempt to read the card UID (and info) with retries to avoid transient failures."""
     uid = None
@@ -424,6 +3074,49 @@ def read_card_with_retry(max_attempts=3, delay=0.1):
     return uid, info
 
 
+# Members still signed in this long after signing in are signed out automatically
+def auto_sign_out_pass(now_ts=None):
+    """Sign out everyone on today's document who has been signed in too long.
+
+    Returns the uids that were signed out.
+    """
+    now_ts = time.time() if now_ts is None else now_ts
+    attendance_day = load_attendance_day(date.today().isoformat())
+    signed_out = []
+    
+    for uid, entry in attendance_day.entries.items():
+        if not entry.signed_in or entry.sign_in is None:
+            continue
+        # Check for override
+        if entry.extra and entry.extra.get("overrideAutoSignOut", False):
+            continue
+        
+        duration = entry.elapsed_hours(now_ts)
+        if duration > hours_policy.auto_close_hours:
+            print(f"Auto signing out {uid} after {duration:.2f} hours")
+            # Close at the policy's cutoff rather than now, the same as cleanup and recompute
+            close_at = hours_policy.auto_close_at(entry.sessions[-1][0])
+            if record_sign_out(uid, ts=close_at, source="auto"):
+                signed_out.append(uid)
+    
+    if signed_out:
+        print("Auto sign-out updates saved")
+    return signed_out
+
+
+def auto_sign_out_loop():
+    """Background thread to auto sign out users after the policy's auto-close time"""
+    print("Starting auto sign-out loop...")
+    while True:
+        try:
+            if db:
+                auto_sign_out_pass()
+        except Exception as e:
+            print(f"Error in auto sign-out loop: {e}")
+        
+        time.sleep(60)  # Check every minute
+
+
 def card_detection_loop():
     """Background thread that continuously checks for card presence"""
     global card_detection_active, current_card_uid, current_card_info, card_status_queue, nfc_reader
@@ -433,7 +3126,7 @@ def card_detection_loop():
     while card_detection_active:
         try:
             if nfc_reader is None:
-                time.sleep(1)
+                reader_available.wait(timeout=1)
                 continue
                 
             card_present = check_card_present()
@@ -444,7 +3137,7 @@ def card_detection_loop():
                 if card_present:
                     # Card detected
                     uid, info = read_card_with_retry()
-                    card_name = get_card_name(uid)
+                    card_name = lookup_card_name(uid)
                     current_card_uid = uid
                     current_card_info = info
                     
@@ -462,47 +3155,21 @@ def card_detection_loop():
                     # Record sign-in or sign-out based on mode
                     if uid and card_name:
                         global sign_in_mode
+                        succeeded, debounced = record_tap(uid, sign_in_mode)
                         if sign_in_mode:
-                            # Sign in mode: record sign-in
-                            if record_sign_in(uid):
-                                card_status_queue.put({
-                                    "status": "card_detected",
-                                    "uid": uid,
-                                    "name": card_name,
-                                    "info": info,
-                                    "action": "signed_in",
-                                    "timestamp": time.time()
-                                })
-                            else:
-                                card_status_queue.put({
-                                    "status": "card_detected",
-                                    "uid": uid,
-                                    "name": card_name,
-                                    "info": info,
-                                    "action": "sign_in_failed",
-                                    "timestamp": time.time()
-                                })
+                            action = "signed_in" if succeeded else "sign_in_failed"
                         else:
-                            # Sign out mode: record sign-out
-                            if record_sign_out(uid):
-                                card_status_queue.put({
-                                    "status": "card_detected",
-                                    "uid": uid,
-                                    "name": card_name,
-                                    "info": info,
-                                    "action": "signed_out",
-                                    "timestamp": time.time()
-                                })
-                            else:
-                                # Not signed in, can't sign out
-                                card_status_queue.put({
-                                    "status": "card_detected",
-                                    "uid": uid,
-                                    "name": card_name,
-                                    "info": info,
-                                    "action": "sign_out_failed",
-                                    "timestamp": time.time()
-                                })
+                            # Failure here usually means not signed in, can't sign out
+                            action = "signed_out" if succeeded else "sign_out_failed"
+                        card_status_queue.put({
+                            "status": "card_detected",
+                            "uid": uid,
+                            "name": card_name,
+                            "info": info,
+                            "action": action,
+                            "debounced": debounced,
+                            "timestamp": time.time()
+                        })
                     else:
                         card_status_queue.put({
                             "status": "card_detected",
@@ -525,41 +3192,158 @@ def card_detection_loop():
             print(f"Error in card detection loop: {e}")
             time.sleep(1)
 
+# ---------------------------------------------------------------------------
+# Sampling profiler
+#
+# `/api/debug/profile?seconds=N` samples the stacks of every thread (request
+# handlers, card detection, auto sign-out, journal replay, ...) for N seconds
+# and returns them in the collapsed format flamegraph.pl and speedscope read:
+# one `thread;outer;...;inner count` line per distinct stack. It only reads
+# sys._current_frames() on a timer, so the server keeps running normally.
+# Requires `ADMIN_TOKEN` to be set and sent as `X-Admin-Token`.
+# ---------------------------------------------------------------------------
+
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+PROFILE_MAX_SECONDS = 60
+# Only one profile at a time; overlapping samplers would skew each other
+profile_lock = threading.Lock()
+
+
+def is_admin_request():
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+def sample_stacks(seconds, interval=0.005):
+    """Sample every other thread's stack for `seconds`; returns (Counter of collapsed stacks, samples)"""
+    me = threading.get_ident()
+    counts = collections.Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}").replace(";", ":"))
+            counts[";".join(reversed(stack))] += 1
+        samples += 1
+        time.sleep(interval)
+    return counts, samples
+
+
+# ---------------------------------------------------------------------------
+# Response encoding
+#
+# The large read endpoints build their responses with compact_response, which
+# negotiates the body with the client:
+#   - `?layout=columnar` sends history arrays as one array per field, so keys
+#     are sent once instead of on every row
+#   - `Accept: application/msgpack` returns MessagePack (needs `msgpack`)
+#   - `Accept-Encoding` selects brotli (needs `brotli`) or gzip
+# JSON is encoded with `orjson` when it is installed. Clients that ask for none
+# of these get the same JSON as before, minus the whitespace.
+# ---------------------------------------------------------------------------
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Bodies smaller than this gain little from compression
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def encode_json(payload):
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+def to_columns(rows):
+    """Turn a list of row dicts into a dict of equal-length field arrays"""
+    columns = {}
+    for i, row in enumerate(rows):
+        for key, value in row.items():
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = [None] * i
+            column.append(value)
+        for key, column in columns.items():
+            if len(column) <= i:
+                column.append(None)
+    return columns
+
+
+def wants_columnar():
+    return request.args.get('layout') == 'columnar'
+
+
+def negotiate_encoding(accept_encoding):
+    """Pick the best content coding the client accepts, or None"""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compact_response(payload, status=200):
+    """Encode a response payload as MessagePack or JSON, compressed if the client allows"""
+    if msgpack is not None and 'application/msgpack' in request.headers.get('Accept', ''):
+        body, mimetype = msgpack.packb(payload, use_bin_type=True), 'application/msgpack'
+    else:
+        body, mimetype = encode_json(payload), 'application/json'
+
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding')) if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding == "br":
+        body = brotli.compress(body, quality=BROTLI_QUALITY)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, status=status, mimetype=mimetype, headers=headers)
+
+
 @app.route('/api/status', methods=['GET'])
 def get_status():
     """Get current NFC reader and card status"""
     global nfc_reader, current_card_uid, current_card_info, card_detection_active, sign_in_mode
     
-    # Always check if readers are available
-    try:
-        r = readers()
-        if len(r) < 1:
-            return jsonify({
-                "readerConnected": False,
-                "readerName": None,
-                "cardPresent": False,
-                "cardUid": None,
-                "cardInfo": None,
-                "detectionActive": card_detection_active,
-                "signInMode": sign_in_mode,
-                "error": "No readers available"
-            })
-        
-        # Initialize if not already done
-        if nfc_reader is None or str(nfc_reader) != str(r[0]):
-            init_result = init_nfc_reader()
-            if "error" in init_result:
-                return jsonify({
-                    "readerConnected": False,
-                    "readerName": None,
-                    "cardPresent": False,
-                    "cardUid": None,
-                    "cardInfo": None,
-                    "detectionActive": card_detection_active,
-                    "signInMode": sign_in_mode,
-                    "error": init_result.get("error", "Failed to initialize reader")
-                })
-    except Exception as e:
+    # Reader discovery is owned by the supervisor thread; only report its view here
+    health = get_reader_health()
+    if not health["connected"]:
         return jsonify({
             "readerConnected": False,
             "readerName": None,
@@ -568,7 +3352,9 @@ def get_status():
             "cardInfo": None,
             "detectionActive": card_detection_active,
             "signInMode": sign_in_mode,
-            "error": str(e)
+            "readerHealth": health,
+            "journal": tap_journal.stats(),
+            "error": health["lastError"] or "No readers available"
         })
     
     card_present = check_card_present()
@@ -583,25 +3369,30 @@ def get_status():
         "cardUid": uid,
         "cardName": card_name,
         "cardInfo": info,
-        "detectionActive": card_detection_active
+        "detectionActive": card_detection_active,
+        "readerHealth": health,
+        "debounce": tap_debouncer.stats(),
+        "journal": tap_journal.stats()
     })
 
 @app.route('/api/start-detection', methods=['POST'])
 def start_detection():
     """Start automatic card detection"""
-    global card_detection_active, card_detection_thread, nfc_reader
+    global card_detection_active, card_detection_thread
     
-    if nfc_reader is None:
-        init_result = init_nfc_reader()
-        if "error" in init_result:
-            return jsonify(init_result), 500
+    # Detection waits for the supervisor to find a reader, so it can be started before one is plugged in
+    start_reader_supervisor()
     
     if not card_detection_active:
         card_detection_active = True
-        card_detection_thread = threading.Thread(target=card_detection_loop, daemon=True)
+        card_detection_thread = threading.Thread(target=card_detection_loop, name="card_detection", daemon=True)
         card_detection_thread.start()
     
-    return jsonify({"success": True, "message": "Card detection started"})
+    return jsonify({
+        "success": True,
+        "message": "Card detection started" if nfc_reader is not None else "Card detection started, waiting for reader",
+        "readerConnected": nfc_reader is not None
+    })
 
 @app.route('/api/stop-detection', methods=['POST'])
 def stop_detection():
@@ -638,13 +3429,12 @@ def api_get_info():
 def api_firmware_version():
     """Get firmware version of the reader"""
     try:
-        connection = get_fresh_connection()
-        if connection is None:
+        session = open_reader_session()
+        if session is None:
             return jsonify({"success": False, "error": "No readers available"}), 500
         
-        connection.connect()
-        cmd = [0xFF, 0x00, 0x48, 0x00, 0x00]
-        data, sw1, sw2 = connection.transmit(cmd)
+        with session:
+            data, sw1, sw2 = session.transmit(cmd_firmware_version())
         version = ''.join(chr(i) for i in data) + chr(sw1) + chr(sw2)
         return jsonify({"success": True, "version": version})
     except Exception as e:
@@ -654,14 +3444,13 @@ def api_firmware_version():
 def api_mute():
     """Disable beep sound"""
     try:
-        connection = get_fresh_connection()
-        if connection is None:
+        session = open_reader_session()
+        if session is None:
             return jsonify({"success": False, "error": "No readers available"}), 500
         
-        connection.connect()
-        cmd = [0xFF, 0x00, 0x52, 0x00, 0x00]
-        data, sw1, sw2 = connection.transmit(cmd)
-        if (sw1, sw2) == (0x90, 0x00):
+        with session:
+            data = session.ok(cmd_set_buzzer(False))
+        if data is not None:
             return jsonify({"success": True, "message": "Beep disabled"})
         else:
             return jsonify({"success": False, "error": "Failed to disable beep"}), 400
@@ -672,14 +3461,13 @@ def api_mute():
 def api_unmute():
     """Enable beep sound"""
     try:
-        connection = get_fresh_connection()
-        if connection is None:
+        session = open_reader_session()
+        if session is None:
             return jsonify({"success": False, "error": "No readers available"}), 500
         
-        connection.connect()
-        cmd = [0xFF, 0x00, 0x52, 0xFF, 0x00]
-        data, sw1, sw2 = connection.transmit(cmd)
-        if (sw1, sw2) == (0x90, 0x00):
+        with session:
+            data = session.ok(cmd_set_buzzer(True))
+        if data is not None:
             return jsonify({"success": True, "message": "Beep enabled"})
         else:
             return jsonify({"success": False, "error": "Failed to enable beep"}), 400
@@ -697,17 +3485,15 @@ def api_load_key():
         if len(key) != 12:
             return jsonify({"success": False, "error": "Key must be 12 hex characters (6 bytes)"}), 400
         
-        connection = get_fresh_connection()
-        if connection is None:
-            return jsonify({"success": False, "error": "No readers available"}), 500
-        
-        connection.connect()
-        cmd = [0xFF, 0x82, 0x00, 0x00, 0x06]
         key_bytes = [int(key[i:i+2], 16) for i in range(0, 12, 2)]
-        cmd.extend(key_bytes)
         
-        data, sw1, sw2 = connection.transmit(cmd)
-        if (sw1, sw2) == (0x90, 0x00):
+        session = open_reader_session()
+        if session is None:
+            return jsonify({"success": False, "error": "No readers available"}), 500
+        
+        with session:
+            data = session.ok(cmd_load_key(key_bytes))
+        if data is not None:
             loaded_key = key
             return jsonify({"success": True, "message": "Key loaded successfully"})
         else:
@@ -715,6 +3501,84 @@ def api_load_key():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+# Key type (A or B) that last authenticated each (card uid, sector), so repeat
+# reads go straight to the right key instead of failing over from Key A
+sector_key_types = {}
+# Whether the reader accepts multi-block READ BINARY; None until probed
+multi_block_read_supported = None
+
+
+def sector_blocks(sector):
+    """Return (first_block, block_count) for a MIFARE Classic sector.
+
+    Sectors 0-31 have 4 blocks; sectors 32-39 on a 4K card have 16 blocks.
+    """
+    if sector < 32:
+        return sector * 4, 4
+    return 128 + (sector - 32) * 16, 16
+
+
+def authenticate_sector(session, sector, card_uid=None):
+    """Authenticate a sector with the loaded key, trying the remembered key type first.
+
+    Returns the key type that worked ("A" or "B"), or None.
+    """
+    first_block, _ = sector_blocks(sector)
+    key_types = ["A", "B"]
+    if sector_key_types.get((card_uid, sector)) == "B":
+        key_types.reverse()
+
+    for key_type in key_types:
+        if session.ok(cmd_authenticate(first_block, key_type)) is not None:
+            sector_key_types[(card_uid, sector)] = key_type
+            return key_type
+    return None
+
+
+def format_block(block, data):
+    return {
+        "block": block,
+        "hex": toHexString(data),
+        "ascii": ''.join(chr(i) if 32 <= i < 127 else '.' for i in data)
+    }
+
+
+def reauthenticate_sector(session, sector, card_uid=None):
+    """Reload the key and authenticate again; MIFARE Classic drops authentication after a NAK"""
+    key_bytes = [int(loaded_key[i:i+2], 16) for i in range(0, 12, 2)]
+    if session.ok(cmd_load_key(key_bytes)) is None:
+        return None
+    return authenticate_sector(session, sector, card_uid)
+
+
+def read_sector_blocks(session, sector, card_uid=None):
+    """Read every block of an authenticated sector.
+
+    Tries a single multi-block READ BINARY first and falls back to one APDU
+    per block on readers that only return 16 bytes at a time.
+    """
+    global multi_block_read_supported
+    first_block, count = sector_blocks(sector)
+
+    if multi_block_read_supported is not False:
+        data, sw1, sw2 = session.transmit(cmd_read_binary(first_block, count * 16))
+        if (sw1, sw2) == (0x90, 0x00) and len(data) == count * 16:
+            multi_block_read_supported = True
+            return [format_block(first_block + i, data[i * 16:(i + 1) * 16]) for i in range(count)]
+        if multi_block_read_supported is None:
+            multi_block_read_supported = False
+        # The failed READ cost us the authentication
+        if reauthenticate_sector(session, sector, card_uid) is None:
+            return []
+
+    blocks = []
+    for block in range(first_block, first_block + count):
+        data = session.ok(cmd_read_binary(block, 16))
+        if data is not None:
+            blocks.append(format_block(block, data))
+    return blocks
+
+
 @app.route('/api/read-sector', methods=['POST'])
 def api_read_sector():
     """Read a sector from the card"""
@@ -726,39 +3590,16 @@ def api_read_sector():
         if loaded_key is None:
             return jsonify({"success": False, "error": "No key loaded. Please load a key first."}), 400
         
-        connection = get_fresh_connection()
-        if connection is None:
+        session = open_reader_session()
+        if session is None:
             return jsonify({"success": False, "error": "No readers available"}), 500
         
-        connection.connect()
-        
-        # Try Key A first
-        cmd = [0xFF, 0x86, 0x00, 0x00, 0x05, 0x01, 0x00, sector * 4, 0x60, 0x00]
-        data, sw1, sw2 = connection.transmit(cmd)
-        key_type = "A"
-        
-        if (sw1, sw2) != (0x90, 0x00):
-            # Try Key B
-            cmd = [0xFF, 0x86, 0x00, 0x00, 0x05, 0x01, 0x00, sector * 4, 0x61, 0x00]
-            data, sw1, sw2 = connection.transmit(cmd)
-            key_type = "B"
-        
-        if (sw1, sw2) != (0x90, 0x00):
-            return jsonify({"success": False, "error": "Failed to authenticate sector"}), 400
-        
-        # Read blocks
-        blocks = []
-        for block in range(sector * 4, sector * 4 + 4):
-            cmd = [0xFF, 0xB0, 0x00, block, 16]
-            data, sw1, sw2 = connection.transmit(cmd)
-            if (sw1, sw2) == (0x90, 0x00):
-                hex_data = toHexString(data)
-                ascii_data = ''.join(chr(i) if 32 <= i < 127 else '.' for i in data)
-                blocks.append({
-                    "block": block,
-                    "hex": hex_data,
-                    "ascii": ascii_data
-                })
+        with session:
+            key_type = authenticate_sector(session, sector, current_card_uid)
+            if key_type is None:
+                return jsonify({"success": False, "error": "Failed to authenticate sector"}), 400
+            
+            blocks = read_sector_blocks(session, sector, current_card_uid)
         
         return jsonify({
             "success": True,
@@ -769,6 +3610,115 @@ def api_read_sector():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/dump-card', methods=['POST'])
+def api_dump_card():
+    """Dump a range of sectors in one reader session, streamed as JSON lines.
+
+    Body: {"startSector": 0, "endSector": 15}. Sector 39 is the last sector on a 4K card.
+    Each line is one sector result with its timing; the final line is a summary.
+    """
+    try:
+        data = request.get_json() or {}
+        start_sector = int(data.get('startSector', 0))
+        end_sector = int(data.get('endSector', 15))
+
+        if not 0 <= start_sector <= end_sector <= 39:
+            return jsonify({"success": False, "error": "Sectors must satisfy 0 <= startSector <= endSector <= 39"}), 400
+
+        if loaded_key is None:
+            return jsonify({"success": False, "error": "No key loaded. Please load a key first."}), 400
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+    if nfc_reader is None:
+        return jsonify({"success": False, "error": "No readers available"}), 500
+
+    def generate():
+        dump_start = time.perf_counter()
+        sectors_read = 0
+        card_uid = None
+        # Opened here so the session is closed even if the client never reads the body
+        try:
+            session = open_reader_session()
+        except Exception as e:
+            session = None
+            error = str(e)
+        else:
+            error = "No readers available"
+        if session is None:
+            yield json.dumps({"success": False, "error": error}) + "\n"
+            return
+        with session:
+            try:
+                uid_bytes = session.ok(cmd_get_uid())
+                card_uid = toHexString(uid_bytes) if uid_bytes is not None else None
+            except Exception as e:
+                yield json.dumps({"success": False, "error": str(e)}) + "\n"
+                return
+            for sector in range(start_sector, end_sector + 1):
+                sector_start = time.perf_counter()
+                try:
+                    key_type = authenticate_sector(session, sector, card_uid)
+                    if key_type is None:
+                        result = {"sector": sector, "success": False, "error": "Failed to authenticate sector"}
+                    else:
+                        result = {
+                            "sector": sector,
+                            "success": True,
+                            "keyType": key_type,
+                            "blocks": read_sector_blocks(session, sector, card_uid)
+                        }
+                        sectors_read += 1
+                except Exception as e:
+                    result = {"sector": sector, "success": False, "error": str(e)}
+                result["elapsedMs"] = round((time.perf_counter() - sector_start) * 1000, 2)
+                yield json.dumps(result) + "\n"
+
+        yield json.dumps({
+            "done": True,
+            "uid": card_uid,
+            "sectorsRead": sectors_read,
+            "sectorsRequested": end_sector - start_sector + 1,
+            "elapsedMs": round((time.perf_counter() - dump_start) * 1000, 2)
+        }) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/reader-stats', methods=['GET'])
+def api_reader_stats():
+    """Get per-command reader latency stats (pass ?reset=1 to clear them afterwards)"""
+    stats = reader_stats.snapshot()
+    if request.args.get('reset') == '1':
+        reader_stats.reset()
+    return jsonify({"success": True, "transport": nfc_transport.split(':', 1)[0], "commands": stats})
+
+@app.route('/api/cache-stats', methods=['GET'])
+def api_cache_stats():
+    """Get read cache hit/miss counters"""
+    return jsonify({"success": True, "cache": read_cache.stats(), "dayCache": dict(day_cache.stats, enabled=day_cache.enabled)})
+
+@app.route('/api/debug/profile', methods=['GET'])
+def api_debug_profile():
+    """Sample all threads for `seconds` (default 10) and return collapsed stacks"""
+    if not is_admin_request():
+        return jsonify({"success": False, "error": "Admin token required"}), 403
+    try:
+        seconds = float(request.args.get('seconds', '10'))
+        interval = float(request.args.get('intervalMs', '5')) / 1000.0
+    except ValueError:
+        return jsonify({"success": False, "error": "seconds and intervalMs must be numbers"}), 400
+    if not 0 < seconds <= PROFILE_MAX_SECONDS or not 0.001 <= interval <= 1:
+        return jsonify({"success": False, "error": f"seconds must be in (0, {PROFILE_MAX_SECONDS}] and intervalMs in [1, 1000]"}), 400
+    if not profile_lock.acquire(blocking=False):
+        return jsonify({"success": False, "error": "A profile is already running"}), 409
+    try:
+        counts, samples = sample_stacks(seconds, interval)
+    finally:
+        profile_lock.release()
+    body = "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+    return Response(body, mimetype='text/plain', headers={"X-Profile-Samples": str(samples)})
+
 @app.route('/api/poll-status', methods=['GET'])
 def poll_status():
     """Poll for card status updates (for polling-based real-time updates)"""
@@ -814,12 +3764,26 @@ def get_card_name_api():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/search-members', methods=['GET'])
+def search_members_api():
+    """Search members by name (prefix or fuzzy) or card UID prefix"""
+    try:
+        query = request.args.get('q', '').strip()
+        limit = int(request.args.get('limit', 10))
+        if not query:
+            return jsonify({"success": False, "error": "q is required"}), 400
+        
+        member_search_index.ensure_current()
+        return jsonify({"success": True, "results": member_search_index.search(query, limit)})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @app.route('/api/get-all-card-names', methods=['GET'])
 def api_get_all_card_names():
     """Get all saved card names"""
     try:
         card_names = get_all_card_names()
-        return jsonify({"success": True, "cardNames": card_names})
+        return compact_response({"success": True, "cardNames": card_names})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -845,12 +3809,56 @@ def record_sign_in_api():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/sync/taps', methods=['POST'])
+def sync_taps_api():
+    """Apply a batch of taps from an edge kiosk and send back the roster if it changed"""
+    if not SYNC_TOKEN:
+        return jsonify({"success": False, "error": "Sync is disabled: SYNC_TOKEN is not set"}), 403
+    if not hmac.compare_digest(request.headers.get('X-Sync-Token', '').encode(), SYNC_TOKEN.encode()):
+        return jsonify({"success": False, "error": "Invalid sync token"}), 403
+    if db is None:
+        return jsonify({"success": False, "error": "Firestore is not available"}), 503
+    try:
+        body = request.get_data()
+        if request.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        data = json.loads(body)
+        taps = data.get('taps') or []
+        kiosk = data.get('kiosk') or request.remote_addr
+        
+        applied = apply_tap_batch(taps)
+        with kiosk_sync_lock:
+            stats = kiosk_sync_stats.setdefault(kiosk, {"taps": 0, "applied": 0})
+            stats["taps"] += len(taps)
+            stats["applied"] += applied
+            stats["lastSyncAt"] = time.time()
+        
+        reply = {"success": True, "received": len(taps), "applied": applied}
+        # Lets the edge answer sign-outs for members who signed in at another door
+        reply["day"] = date.today().isoformat()
+        reply["signedIn"] = [status["uid"] for status in get_attendance_status() if status["signedIn"]]
+        names = get_all_card_names()
+        if names and roster_digest(names) != data.get('rosterDigest'):
+            reply["roster"] = names
+        return jsonify(reply)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/sync/kiosks', methods=['GET'])
+def sync_kiosks_api():
+    """List edge kiosks that have synced with this server"""
+    with kiosk_sync_lock:
+        kiosks = {kiosk: dict(stats) for kiosk, stats in kiosk_sync_stats.items()}
+    return jsonify({"success": True, "kiosks": kiosks})
+
 @app.route('/api/attendance-status', methods=['GET'])
 def attendance_status_api():
     """Get attendance status for all registered cards"""
     try:
         status_list = get_attendance_status()
-        return jsonify({"success": True, "attendance": status_list})
+        if wants_columnar():
+            status_list = to_columns(status_list)
+        return compact_response({"success": True, "attendance": status_list})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -866,7 +3874,104 @@ def person_profile_api():
         if profile is None:
             return jsonify({"success": False, "error": "Person not found"}), 404
         
-        return jsonify({"success": True, "profile": profile})
+        if wants_columnar():
+            # Copy rather than modify the cached profile
+            profile = dict(profile, attendanceHistory=to_columns(profile["attendanceHistory"]))
+        return compact_response({"success": True, "profile": profile})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/export', methods=['GET'])
+def export_api():
+    """Stream attendance history joined with card names as CSV or Parquet.
+
+    Query params: format (csv|parquet), start and end (inclusive ISO dates), uid.
+    """
+    fmt = request.args.get('format', 'csv')
+    start = request.args.get('start')
+    end = request.args.get('end')
+    uid = request.args.get('uid')
+
+    try:
+        for value in (start, end):
+            if value:
+                date.fromisoformat(value)
+    except ValueError:
+        return jsonify({"success": False, "error": "start and end must be ISO dates (YYYY-MM-DD)"}), 400
+
+    if db is None:
+        return jsonify({"success": False, "error": "Database not available"}), 500
+
+    rows = iter_attendance_rows(start, end, uid)
+    if fmt == 'csv':
+        body, mimetype = iter_export_csv(rows), 'text/csv'
+    elif fmt == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return jsonify({"success": False, "error": "Parquet export requires pyarrow to be installed"}), 400
+        body, mimetype = iter_export_parquet(rows), 'application/vnd.apache.parquet'
+    else:
+        return jsonify({"success": False, "error": "format must be 'csv' or 'parquet'"}), 400
+
+    filename = f"attendance_{start or 'all'}_{end or 'all'}.{fmt}"
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@app.route('/api/leaderboard', methods=['GET'])
+def leaderboard_api():
+    """Get the season leaderboard.
+
+    Query params: limit (default 10), by (hours|days), uid (include that member's rank).
+    """
+    try:
+        limit = int(request.args.get('limit', 10))
+        by = request.args.get('by', 'hours')
+        uid = request.args.get('uid')
+        if by not in ('hours', 'days'):
+            return jsonify({"success": False, "error": "by must be 'hours' or 'days'"}), 400
+        if db is None:
+            return jsonify({"success": False, "error": "Database not available"}), 500
+
+        season_summary.ensure_built()
+        names = get_all_card_names()
+        result = {
+            "success": True,
+            "season": season_summary.info(),
+            "leaders": season_summary.top(limit, by, names)
+        }
+        if uid:
+            result["member"] = season_summary.rank_of(uid, by, names)
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/rollups', methods=['GET'])
+def rollups_api():
+    """Team totals for a date range from the weekly, monthly and season rollups.
+
+    Query params: start and end (inclusive ISO dates, default the current
+    season up to today), group (day|week|month|season, default week).
+    """
+    start = request.args.get('start') or default_season_start()
+    end = request.args.get('end') or date.today().isoformat()
+    group = request.args.get('group', 'week')
+    if group not in ("day",) + ROLLUP_KINDS:
+        return jsonify({"success": False, "error": "group must be day, week, month or season"}), 400
+    try:
+        date.fromisoformat(start)
+        date.fromisoformat(end)
+    except ValueError:
+        return jsonify({"success": False, "error": "start and end must be ISO dates"}), 400
+    if start > end:
+        return jsonify({"success": False, "error": "start must not be after end"}), 400
+    if db is None:
+        return jsonify({"success": False, "error": "Database not available"}), 500
+    try:
+        return compact_response(dict(query_rollups(start, end, group), success=True))
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -922,58 +4027,22 @@ def get_mode():
     })
 
 if __name__ == '__main__':
-    # Initialize reader on startup
-    init_nfc_reader()
+    # With debug=True the Werkzeug reloader runs this module twice: a parent that
+    # only watches files, and the child that serves (WERKZEUG_RUN_MAIN=true).
+    # Background workers must run once, in the child, or two of them would poll
+    # the reader and replay the same journal file.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        # Discover the reader and keep it connected in the background
+        start_reader_supervisor()
 
-    # Start auto sign-out thread
-    def auto_sign_out_loop():
-        """Background thread to auto sign out users after 2 hours"""
-        print("Starting auto sign-out loop...")
-        while True:
-            try:
-                if db:
-                    today = date.today().isoformat()
-                    doc_ref = db.collection('attendance').document(today)
-                    doc = doc_ref.get()
-                    
-                    if doc.exists:
-                        attendance_day = doc.to_dict()
-                        now = datetime.now()
-                        updates_made = False
-                        
-                        for uid, entry in attendance_day.items():
-                            if entry.get("signed_in", False):
-                                # Check for override
-                                if entry.get("overrideAutoSignOut", False):
-                                    continue
-                                    
-                                sign_in_time_str = entry.get("sign_in_time")
-                                if sign_in_time_str:
-                                    sign_in_time = datetime.fromisoformat(sign_in_time_str)
-                                    duration = (now - sign_in_time).total_seconds() / 3600.0
-                                    
-                                    if duration > 2.0:
-                                        print(f"Auto signing out {uid} after {duration:.2f} hours")
-                                        # Calculate hours
-                                        hours = duration
-                                        
-                                        # Update entry
-                                        attendance_day[uid]["sign_out_time"] = now.isoformat()
-                                        attendance_day[uid]["hours"] = round(hours, 2)
-                                        attendance_day[uid]["signed_in"] = False
-                                        updates_made = True
-                        
-                        if updates_made:
-                            doc_ref.set(attendance_day)
-                            print("Auto sign-out updates saved")
-                            
-            except Exception as e:
-                print(f"Error in auto sign-out loop: {e}")
-            
-            time.sleep(60)  # Check every minute
+        # Replay journaled taps to Firestore in the background
+        start_tap_journal()
 
-    auto_sign_out_thread = threading.Thread(target=auto_sign_out_loop, daemon=True)
-    auto_sign_out_thread.start()
+        # Start auto sign-out and rollup threads (edge kiosks leave these to the central server)
+        if not CENTRAL_URL:
+            auto_sign_out_thread = threading.Thread(target=auto_sign_out_loop, name="auto_sign_out", daemon=True)
+            auto_sign_out_thread.start()
+            threading.Thread(target=rollup_loop, name="rollups", daemon=True).start()
     # Optionally start periodic remote sync if REMOTE_SYNC_INTERVAL_MIN is set
     # (Removed in favor of direct Firebase integration)
     # For local/public exposure, prefer Cloudflare Tunnel (cloudflared).
@@ -982,5 +4051,5 @@ if __name__ == '__main__':
     # Or create a named tunnel and route DNS (see `scripts/cloudflared_setup.sh`).
 
     # Start Flask app
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', '5001')), debug=True)
 